@@ -4,28 +4,88 @@ Flask API server for charger status data
 Provides endpoints for widgets to fetch current and historical data
 """
 
-from flask import Flask, jsonify, request
-from charger_scraper import ChargerScraper
+from flask import Flask, Response, jsonify, request
+from charger_scraper import STATION_URL_TEMPLATE, ChargerScraper
+from check_queue import CheckJobQueue
+from forecast import AvailabilityForecaster
+from insights_cache import InsightsCache
+from status_cache import LatestStatusCache
+from status_stream import StatusBroadcaster
+from storage import normalize_timestamp
+from utilization_analysis import ANALYSIS_SECTIONS, UtilizationAnalyzer
+from itertools import islice
+import csv
+import io
+import json
 import logging
+import metrics
 import os
+import threading
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-scraper = ChargerScraper()
+
+# Built by init_state() on the first request, so importing the app opens no database or thread pool
+scraper = None
+status_cache = None
+broadcaster = None
+check_queue = None
+insights_cache = None
+forecaster = None
+_state_lock = threading.Lock()
+
+def init_state():
+    """Create the scraper, caches, check queue and forecaster once"""
+    global scraper, status_cache, broadcaster, check_queue, insights_cache, forecaster
+    with _state_lock:
+        if scraper is not None:
+            return
+        # DB_PATH and STATION_URL_TEMPLATE point the server at another database or page source (e.g. a load test)
+        new_scraper = ChargerScraper(os.environ.get('DB_PATH', 'charger_data.db'),
+                                     url_template=os.environ.get('STATION_URL_TEMPLATE', STATION_URL_TEMPLATE))
+        status_cache = LatestStatusCache(new_scraper)
+        broadcaster = StatusBroadcaster()
+        new_scraper.add_listener(broadcaster.publish)
+        # Manual checks of the same station closer together than this reuse the last result
+        check_stations = [int(station) for station in os.environ.get('CHECK_STATIONS', '').split(',') if station.strip()]
+        check_queue = CheckJobQueue(new_scraper, min_interval=float(os.environ.get('CHECK_MIN_INTERVAL', 60)),
+                                    stations=check_stations)
+        insights_cache = InsightsCache(new_scraper.db_path)
+        # Per-station slot models, built in the background and updated as observations are stored
+        forecaster = AvailabilityForecaster(new_scraper.db_path)
+        new_scraper.add_listener(forecaster.on_store)
+        forecaster.warm(new_scraper.location_id)
+        # Published last: other threads skip the lock once scraper is set
+        scraper = new_scraper
+
+@app.before_request
+def ensure_state():
+    if scraper is None:
+        init_state()
+
+# Widgets may reuse a status for this long before revalidating with If-None-Match
+STATUS_MAX_AGE = int(os.environ.get('STATUS_MAX_AGE', 30))
+# Longest a streaming client waits before a keep-alive or an empty long-poll reply
+STREAM_TIMEOUT = 25
+# Longest analysis window served by /api/insights
+INSIGHTS_MAX_DAYS = 366
 
 @app.route('/api/status', methods=['GET'])
 def get_current_status():
     """Get the current/latest charger status"""
     try:
-        status_data = scraper.get_latest_status()
-        if status_data:
-            return jsonify({
+        entry = status_cache.get(request.args.get('station', type=int))
+        if entry:
+            response = jsonify({
                 'success': True,
-                'data': status_data
+                'data': entry['data']
             })
+            response.set_etag(entry['etag'])
+            response.cache_control.max_age = STATUS_MAX_AGE
+            return response.make_conditional(request)
         else:
             return jsonify({
                 'success': False,
@@ -38,19 +98,81 @@ def get_current_status():
             'error': 'Internal server error'
         }), 500
 
+def _history_rows(rows, fmt):
+    """Encode history rows one at a time as NDJSON lines or CSV records"""
+    if fmt == 'ndjson':
+        for row in rows:
+            yield json.dumps(row) + '\n'
+        return
+    
+    buffer = io.StringIO()
+    writer = None
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(row.keys()), extrasaction='ignore')
+            writer.writeheader()
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
 @app.route('/api/history', methods=['GET'])
 def get_status_history():
-    """Get historical status data"""
+    """Get historical status data, newest first
+
+    Query parameters: limit, cursor (keyset: the next_cursor of the previous
+    page), start/end (ISO-8601 range), station, expand, and format (json, or
+    ndjson/csv to stream every matching row without the 1000-row cap).
+    """
     try:
-        limit = request.args.get('limit', 100, type=int)
+        try:
+            bounds = {
+                # An unencoded '+' in a UTC offset arrives as a space
+                key: normalize_timestamp(request.args[arg].replace(' ', '+'))
+                for key, arg in (('start', 'start'), ('end', 'end'), ('before', 'cursor'))
+                if request.args.get(arg)
+            }
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': 'start, end and cursor must be ISO-8601 timestamps'
+            }), 400
+        
+        fmt = request.args.get('format', 'json')
+        streaming = fmt in ('ndjson', 'csv')
+        limit = request.args.get('limit', None if streaming else 100, type=int)
+        if limit is not None and limit < 0:
+            return jsonify({
+                'success': False,
+                'error': 'limit must not be negative'
+            }), 400
+        
+        station = request.args.get('station', type=int)
+        expand = request.args.get('expand', 'false').lower() == 'true'
+        rows = scraper.iter_status_history(station, expand=expand, **bounds)
+        
+        if streaming:
+            if limit is not None:
+                rows = islice(rows, limit)
+            mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'text/csv'
+            return Response(_history_rows(rows, fmt), mimetype=mimetype)
+        
         if limit > 1000:  # Prevent excessive data requests
             limit = 1000
             
-        history = scraper.get_status_history(limit)
+        # Fetch one extra row to know whether another page follows
+        history = list(islice(rows, limit + 1)) if limit else []
+        rows.close()
+        next_cursor = None
+        if len(history) > limit:
+            history = history[:limit]
+            next_cursor = history[-1]['timestamp']
+        
         return jsonify({
             'success': True,
             'data': history,
-            'count': len(history)
+            'count': len(history),
+            'next_cursor': next_cursor
         })
     except Exception as e:
         logger.error(f"Error getting status history: {e}")
@@ -59,21 +181,115 @@ def get_status_history():
             'error': 'Internal server error'
         }), 500
 
+@app.route('/api/insights', methods=['GET'])
+def get_insights():
+    """Get the utilization report, recomputed only when new rows entered the window
+
+    Query parameters: station, days (default 7) and sections (comma-separated
+    subset of hourly, daily, optimal).
+    """
+    try:
+        days = request.args.get('days', 7, type=int)
+        sections = request.args.get('sections', ','.join(ANALYSIS_SECTIONS)).split(',')
+        if not 1 <= days <= INSIGHTS_MAX_DAYS or not set(sections) <= set(ANALYSIS_SECTIONS):
+            return jsonify({
+                'success': False,
+                'error': f"days must be 1-{INSIGHTS_MAX_DAYS} and sections a subset of {','.join(ANALYSIS_SECTIONS)}"
+            }), 400
+        
+        station = request.args.get('station', type=int) or scraper.location_id
+        analyzer = UtilizationAnalyzer(scraper.db_path, station)
+        key, payload = insights_cache.report_raw(analyzer, days, sections)
+        
+        # The cached report is already JSON; splice it in rather than re-encoding it
+        response = Response('{"success": true, "data": ' + payload + '}', mimetype='application/json')
+        response.set_etag(key)
+        response.cache_control.max_age = STATUS_MAX_AGE
+        return response.make_conditional(request)
+    except Exception as e:
+        logger.error(f"Error getting insights: {e}")
+        return jsonify({
+            'success': False,
+            'error': 'Internal server error'
+        }), 500
+
+@app.route('/api/forecast', methods=['GET'])
+def get_forecast():
+    """Predict availability and expected wait for a 15-minute slot of the week
+
+    Query parameters: station and at (ISO-8601, default now).
+    """
+    try:
+        at = request.args.get('at')
+        try:
+            # An unencoded '+' in a UTC offset arrives as a space
+            at = normalize_timestamp(at.replace(' ', '+')) if at else None
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': 'at must be an ISO-8601 timestamp'
+            }), 400
+        
+        station = request.args.get('station', type=int) or scraper.location_id
+        return jsonify({
+            'success': True,
+            # Never waits on a model build; data.ready is false until the station's model exists
+            'data': forecaster.predict(station, at, wait=False)
+        })
+    except Exception as e:
+        logger.error(f"Error getting forecast: {e}")
+        return jsonify({
+            'success': False,
+            'error': 'Internal server error'
+        }), 500
+
+# Longest a caller may block on ?wait= for a manual check to finish
+CHECK_MAX_WAIT = 30
+
+def _job_response(job, reason=None):
+    """JSON body for a check job, with the old completion message once it is done"""
+    body = {
+        'success': job['state'] != 'failed',
+        'job': job
+    }
+    if reason:
+        body['reason'] = reason
+    if job['state'] == 'done':
+        body['message'] = f"Status check completed: {job['status']}"
+    elif job['state'] == 'failed':
+        body['error'] = job['error']
+    return body
+
 @app.route('/api/check', methods=['POST'])
 def trigger_status_check():
-    """Manually trigger a status check"""
+    """Queue a manual status check; duplicates for a station share one scrape"""
     try:
-        success, status = scraper.run_single_check()
-        if success:
-            return jsonify({
-                'success': True,
-                'message': f'Status check completed: {status}'
-            })
-        else:
+        job, reason = check_queue.submit(request.args.get('station', type=int))
+        if reason == 'unknown_station':
             return jsonify({
                 'success': False,
-                'error': 'Status check failed'
-            }), 500
+                'error': 'Station is not configured for checks'
+            }), 404
+        if reason == 'busy':
+            response = jsonify({
+                'success': False,
+                'error': 'Too many checks pending, retry later'
+            })
+            response.status_code = 429
+            response.headers['Retry-After'] = '5'
+            return response
+        
+        # Optional blocking mode for clients that want the result in one call
+        wait = min(request.args.get('wait', 0, type=float), CHECK_MAX_WAIT)
+        if wait > 0 and job['state'] in ('queued', 'running'):
+            job = check_queue.wait(job['id'], wait)
+        
+        pending = job['state'] in ('queued', 'running')
+        status_code = 202 if pending else (500 if job['state'] == 'failed' else 200)
+        response = jsonify(_job_response(job, reason))
+        response.status_code = status_code
+        response.headers['Location'] = f"/api/check/{job['id']}"
+        return response
     except Exception as e:
         logger.error(f"Error triggering status check: {e}")
         return jsonify({
@@ -81,6 +297,92 @@ def trigger_status_check():
             'error': 'Internal server error'
         }), 500
 
+@app.route('/api/check/<job_id>', methods=['GET'])
+def get_check_job(job_id):
+    """Get the state of a queued status check"""
+    job = check_queue.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Unknown check job'
+        }), 404
+    return jsonify(_job_response(job))
+
+def _subscribe(station):
+    """Start watching a station for changes, returns its current status entry"""
+    station = station or scraper.location_id
+    entry = status_cache.get(station)
+    broadcaster.prime(station, entry['data'] if entry else None)
+    broadcaster.start_watcher(status_cache)
+    return station, entry
+
+@app.route('/api/changes', methods=['GET'])
+def get_status_changes():
+    """Long-poll for status changes after a cursor"""
+    try:
+        station, entry = _subscribe(request.args.get('station', type=int))
+        since = request.args.get('since', type=int)
+        timeout = min(request.args.get('timeout', STREAM_TIMEOUT, type=float), STREAM_TIMEOUT)
+        
+        # Without a usable cursor (none, from before a restart, or evicted), answer
+        # immediately with the current status and cursor
+        if since is None or not broadcaster.is_valid(since):
+            body = {
+                'success': True,
+                'cursor': broadcaster.cursor,
+                'data': [],
+                'current': entry['data'] if entry else None
+            }
+            if since is not None:
+                body['reset'] = True
+            return jsonify(body)
+        
+        events = broadcaster.wait(since, timeout, station)
+        return jsonify({
+            'success': True,
+            'cursor': events[-1]['id'] if events else max(since, broadcaster.cursor),
+            'data': events
+        })
+    except Exception as e:
+        logger.error(f"Error waiting for status changes: {e}")
+        return jsonify({
+            'success': False,
+            'error': 'Internal server error'
+        }), 500
+
+@app.route('/api/stream', methods=['GET'])
+def stream_status_changes():
+    """Server-Sent Events stream of status changes"""
+    station, entry = _subscribe(request.args.get('station', type=int))
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    if last_event_id is not None and not broadcaster.is_valid(last_event_id):
+        # Resuming from another server process or evicted events: start over from the current status
+        last_event_id = None
+    
+    def generate():
+        cursor = broadcaster.cursor if last_event_id is None else last_event_id
+        yield 'retry: 5000\n\n'
+        if last_event_id is None and entry:
+            yield f"event: status\ndata: {json.dumps(entry['data'])}\n\n"
+        while True:
+            events = broadcaster.wait(cursor, STREAM_TIMEOUT, station)
+            if not events:
+                yield ': keep-alive\n\n'
+                continue
+            for event in events:
+                cursor = event['id']
+                yield f"id: {event['id']}\nevent: change\ndata: {json.dumps(event)}\n\n"
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Counters and latency histograms of this process in the Prometheus text format"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
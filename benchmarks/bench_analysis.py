@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the utilization analysis paths
+Compares the pandas per-sample path with the NumPy time-weighted engine on synthetic multi-year data
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic_history import synthetic_timeline
+from utilization_analysis import STATUS_CATEGORIES, UtilizationAnalyzer
+
+def pandas_path(analyzer, ts, codes):
+    """The per-sample analysis: derived columns, status mapping and sample-mean insights"""
+    df = pd.DataFrame({
+        'timestamp': pd.to_datetime(ts, unit='s', utc=True),
+        'status': pd.Categorical.from_codes(codes, STATUS_CATEGORIES)
+    })
+    return analyzer.generate_insights(analyzer.prepare_samples(df))
+
+def engine_path(analyzer, ts, codes):
+    """The vectorized duration-weighted analysis"""
+    return analyzer.analyze_time_weighted((ts, codes, None))
+
+def time_path(path, analyzer, ts, codes, repeat):
+    """Best-of-repeat time for one analysis, in milliseconds"""
+    timer = timeit.Timer(lambda: path(analyzer, ts, codes))
+    return min(timer.repeat(repeat=repeat, number=1)) * 1000
+
+def run_benchmark(years_list, repeat, seed=0):
+    """Time both paths for each dataset size and compare their availability figures"""
+    analyzer = UtilizationAnalyzer(':memory:')
+    results = []
+    for years in years_list:
+        ts, codes = synthetic_timeline(years, seed=seed)
+        pandas_insights = pandas_path(analyzer, ts, codes)
+        engine_insights = engine_path(analyzer, ts, codes)
+        pandas_ms = time_path(pandas_path, analyzer, ts, codes, repeat)
+        engine_ms = time_path(engine_path, analyzer, ts, codes, repeat)
+        results.append({
+            'years': years,
+            'observations': len(ts),
+            'pandas_ms': round(pandas_ms, 1),
+            'engine_ms': round(engine_ms, 1),
+            'speedup': round(pandas_ms / engine_ms, 1) if engine_ms else None,
+            'sample_mean_availability': pandas_insights['overall_utilization']['availability'],
+            'time_weighted_availability': engine_insights['availability'],
+            'unknown_hours': engine_insights['unknown_hours']
+        })
+    return results
+
+def print_results(results):
+    """Print one line per dataset size"""
+    header = (f"{'years':>6} {'observations':>13} {'pandas ms':>10} {'engine ms':>10} {'speedup':>8}"
+              f" {'sample avail':>13} {'weighted avail':>15}")
+    print(header)
+    print('-' * len(header))
+    for row in results:
+        print(f"{row['years']:>6} {row['observations']:>13} {row['pandas_ms']:>10.1f} {row['engine_ms']:>10.1f}"
+              f" {row['speedup']:>7}x {row['sample_mean_availability']:>12}% {row['time_weighted_availability']:>14}%")
+
+def main():
+    """Main function for command-line usage"""
+    parser = argparse.ArgumentParser(description='Benchmark the utilization analysis paths on synthetic data')
+    parser.add_argument('--years', type=float, nargs='+', default=[1, 3, 5],
+                        help='Dataset sizes in years of 5-minute polling (default: 1 3 5)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing runs per path (default: 3)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the synthetic data')
+    parser.add_argument('--output', type=str, help='Output file for JSON results')
+
+    args = parser.parse_args()
+
+    results = run_benchmark(args.years, args.repeat, args.seed)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the page status extractors
+Compares parse time and agreement with the selector cascade over saved HTML fixtures
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from status_extractors import SelectorCascadeExtractor, get_extractor
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'chargehub')
+
+def load_fixtures(fixtures_dir=FIXTURES_DIR):
+    """Load every saved page in the fixtures directory, keyed by file name"""
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, '*.html'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            fixtures[os.path.basename(path)] = f.read()
+    return fixtures
+
+def time_extractor(extractor, html, repeat):
+    """Best-of-three mean time per extraction, in milliseconds"""
+    timer = timeit.Timer(lambda: extractor.extract(html))
+    return min(timer.repeat(repeat=3, number=repeat)) / repeat * 1000
+
+def run_benchmark(names, repeat, fixtures_dir=FIXTURES_DIR):
+    """Time each extractor on each fixture and check it agrees with the cascade"""
+    fixtures = load_fixtures(fixtures_dir)
+    reference = SelectorCascadeExtractor()
+    extractors = {name: get_extractor(name) for name in names}
+
+    results = {'fixtures': {}, 'summary': {}}
+    for fixture, html in fixtures.items():
+        expected = reference.extract(html)
+        row = {'expected': expected, 'size_bytes': len(html.encode('utf-8'))}
+        for name, extractor in extractors.items():
+            row[name] = {
+                'status': extractor.extract(html),
+                'ms': round(time_extractor(extractor, html, repeat), 3)
+            }
+        results['fixtures'][fixture] = row
+
+    for name in names:
+        rows = results['fixtures'].values()
+        total_ms = sum(row[name]['ms'] for row in rows)
+        agree = sum(1 for row in rows if row[name]['status'] == row['expected'])
+        results['summary'][name] = {
+            'total_ms': round(total_ms, 3),
+            'agreement': f"{agree}/{len(fixtures)}"
+        }
+
+    if 'cascade' in names:
+        baseline = results['summary']['cascade']['total_ms']
+        for name in names:
+            total = results['summary'][name]['total_ms']
+            results['summary'][name]['speedup'] = round(baseline / total, 2) if total else None
+
+    return results
+
+def print_results(results, names):
+    """Print a per-fixture timing table and the summary"""
+    header = f"{'fixture':32} {'expected':13}" + ''.join(f" {name + ' ms':>12}" for name in names)
+    print(header)
+    print('-' * len(header))
+    for fixture, row in results['fixtures'].items():
+        line = f"{fixture:32} {row['expected']:13}"
+        for name in names:
+            mark = '' if row[name]['status'] == row['expected'] else ' !'
+            line += f" {row[name]['ms']:>12.3f}{mark}"
+        print(line)
+    print()
+    for name, summary in results['summary'].items():
+        print(f"{name:8} total {summary['total_ms']:.3f} ms, agreement {summary['agreement']}, "
+              f"speedup {summary.get('speedup')}x")
+
+def main():
+    """Main function for command-line usage"""
+    parser = argparse.ArgumentParser(description='Benchmark status extractors on saved ChargeHub pages')
+    parser.add_argument('--extractors', nargs='+', default=['cascade', 'lxml', 'auto'],
+                        help='Extractors to compare (default: cascade lxml auto)')
+    parser.add_argument('--repeat', type=int, default=20, help='Extractions per timing run (default: 20)')
+    parser.add_argument('--fixtures', type=str, default=FIXTURES_DIR, help='Directory of saved HTML pages')
+    parser.add_argument('--output', type=str, help='Output file for JSON results')
+
+    args = parser.parse_args()
+
+    results = run_benchmark(args.extractors, args.repeat, args.fixtures)
+    print_results(results, args.extractors)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+    # Non-zero exit when an extractor disagrees with the reference cascade
+    disagreements = [
+        name for name, summary in results['summary'].items()
+        if summary['agreement'].split('/')[0] != summary['agreement'].split('/')[1]
+    ]
+    return 1 if disagreements else 0
+
+if __name__ == "__main__":
+    exit(main())
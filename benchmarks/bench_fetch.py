@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the ChargeHub fetch policy
+Compares fetch latency percentiles of plain requests and the hedged, retrying policy against the stub server
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_chargehub import FakeChargeHub
+from fetch_policy import FetchPolicy
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(int(fraction * len(samples)), len(samples) - 1)]
+
+def time_fetches(fetch, url, count):
+    """Per-fetch latencies in milliseconds and the number of failed fetches"""
+    latencies = []
+    failures = 0
+    for _ in range(count):
+        started = time.perf_counter()
+        try:
+            if fetch(url).status_code != 200:
+                failures += 1
+        except requests.exceptions.RequestException:
+            failures += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies, failures
+
+def run_benchmark(count, latency, slow_fraction, slow_latency, error_rate, seed=0):
+    """Fetch the same page count times with each client against identically seeded stub servers"""
+    results = []
+    for name in ('plain', 'policy'):
+        with FakeChargeHub(latency=latency, slow_fraction=slow_fraction, slow_latency=slow_latency,
+                           error_rate=error_rate, seed=seed) as hub:
+            url = hub.url_template.format(location_id=1)
+            session = requests.Session()
+            if name == 'plain':
+                fetch = lambda url: session.get(url, timeout=30)
+                policy = None
+            else:
+                # Hedge on the stub's own p95 once enough responses are seen
+                policy = FetchPolicy(hedge_min_samples=10, reset_timeout=1.0)
+                fetch = lambda url: policy.get(session, url)
+            latencies, failures = time_fetches(fetch, url, count)
+            if policy is not None:
+                policy.close()
+            session.close()
+            results.append({
+                'client': name,
+                'fetches': count,
+                'server_requests': hub.requests,
+                'failures': failures,
+                'p50_ms': round(percentile(latencies, 0.5), 1),
+                'p95_ms': round(percentile(latencies, 0.95), 1),
+                'p99_ms': round(percentile(latencies, 0.99), 1),
+                'max_ms': round(max(latencies), 1),
+                'stats': dict(policy.stats) if policy is not None else None
+            })
+    return results
+
+def print_results(results):
+    """Print one line per client"""
+    header = (f"{'client':8} {'fetches':>8} {'requests':>9} {'failures':>9}"
+              f" {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    print(header)
+    print('-' * len(header))
+    for row in results:
+        print(f"{row['client']:8} {row['fetches']:>8} {row['server_requests']:>9} {row['failures']:>9}"
+              f" {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}")
+        if row['stats']:
+            print(f"{'':8} {', '.join(f'{key} {value}' for key, value in row['stats'].items())}")
+
+def main():
+    """Main function for command-line usage"""
+    parser = argparse.ArgumentParser(description='Benchmark fetch latency with and without the fetch policy')
+    parser.add_argument('--count', type=int, default=100, help='Fetches per client (default: 100)')
+    parser.add_argument('--latency', type=float, default=0.02, help='Normal reply latency in seconds (default: 0.02)')
+    parser.add_argument('--slow-fraction', type=float, default=0.05,
+                        help='Fraction of slow replies (default: 0.05)')
+    parser.add_argument('--slow-latency', type=float, default=1.5, help='Slow reply latency (default: 1.5)')
+    parser.add_argument('--error-rate', type=float, default=0.02, help='Fraction of 503 replies (default: 0.02)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the stub server')
+    parser.add_argument('--output', type=str, help='Output file for JSON results')
+
+    args = parser.parse_args()
+
+    results = run_benchmark(args.count, args.latency, args.slow_fraction, args.slow_latency,
+                            args.error_rate, args.seed)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
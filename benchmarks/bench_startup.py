@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark for process startup of the command-line entry points
+Measures import time per module with -X importtime and wall-clock time of the widget script
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WIDGET_SCRIPT = os.path.join(REPO_ROOT, 'ubersicht_widget', 'charger-status.widget', 'get_status.py')
+
+# Modules imported by each entry point before it does any work
+ENTRY_POINTS = [
+    'status_extractors',
+    'charger_scraper',
+    'utilization_analysis',
+    'forecast',
+    'rollups',
+    'api_server'
+]
+
+def import_times(module, work_dir):
+    """{module: cumulative microseconds} from one interpreter importing module"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=work_dir, env=dict(os.environ, PYTHONPATH=REPO_ROOT), capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed: {result.stderr.strip().splitlines()[-1]}")
+
+    times = {}
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.strip() == 'site':
+            # Children are listed before their parent: everything so far was interpreter startup
+            times = {}
+            continue
+        times[name.strip()] = int(cumulative)
+    return times
+
+def wall_time(command, repeat, work_dir, env=None):
+    """Best-of-repeat wall-clock time of a command, in milliseconds"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run(command, cwd=work_dir, env=env, capture_output=True)
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run_benchmark(modules, repeat, top=5):
+    """Import cost of each entry point with its heaviest dependencies, and the widget's run time"""
+    # Entry points write logs, caches and databases into their working directory; keep them out of the repo
+    with tempfile.TemporaryDirectory() as work_dir:
+        return _run_benchmark(modules, repeat, top, work_dir)
+
+def _run_benchmark(modules, repeat, top, work_dir):
+    results = {'interpreter_ms': round(wall_time([sys.executable, '-c', 'pass'], repeat, work_dir), 1),
+               'imports': []}
+    for module in modules:
+        best = None
+        for _ in range(repeat):
+            times = import_times(module, work_dir)
+            if best is None or times[module] < best[module]:
+                best = times
+        heaviest = sorted(
+            ((name, us) for name, us in best.items() if name != module and '.' not in name),
+            key=lambda item: item[1], reverse=True
+        )[:top]
+        results['imports'].append({
+            'module': module,
+            'import_ms': round(best[module] / 1000, 1),
+            'heaviest': [{'module': name, 'ms': round(us / 1000, 1)} for name, us in heaviest]
+        })
+    widget_env = dict(os.environ, CHARGER_STATUS_CACHE=os.path.join(work_dir, '.status_cache.json'))
+    results['widget_ms'] = round(wall_time([sys.executable, WIDGET_SCRIPT], repeat, work_dir, widget_env), 1)
+    return results
+
+def print_results(results):
+    """Print one line per entry point, then the widget's wall-clock time"""
+    header = f"{'module':22} {'import ms':>10}  heaviest top-level imports"
+    print(header)
+    print('-' * len(header))
+    for row in results['imports']:
+        heaviest = ', '.join(f"{item['module']} {item['ms']:.0f}" for item in row['heaviest'])
+        print(f"{row['module']:22} {row['import_ms']:>10.1f}  {heaviest}")
+    print(f"\nBare interpreter: {results['interpreter_ms']:.1f} ms")
+    print(f"Widget script:    {results['widget_ms']:.1f} ms")
+
+def main():
+    """Main function for command-line usage"""
+    parser = argparse.ArgumentParser(description='Benchmark startup time of the command-line entry points')
+    parser.add_argument('--modules', type=str, nargs='+', default=ENTRY_POINTS,
+                        help='Modules to time (default: every entry point)')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement, best is kept (default: 5)')
+    parser.add_argument('--output', type=str, help='Output file for JSON results')
+
+    args = parser.parse_args()
+
+    results = run_benchmark(args.modules, args.repeat)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for the scraper, storage and analysis hot paths
+Runs against the saved ChargeHub pages, a local stub server and a synthetic history database,
+and compares the results with a stored baseline to flag regressions
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_extractors import load_fixtures
+from fake_chargehub import FakeChargeHub
+from synthetic_history import generate_history, station_ids
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# Sizes of the generated history; they vary slightly with the time of day it ends at, so baselines are matched without them
+DATASET_KEYS = ('observations', 'analyzed_samples')
+
+def measure(func, number, repeat):
+    """Best-of-repeat mean time per call in milliseconds, and the spread of the runs
+
+    The spread is how far the median run was above the best one, a measure of
+    how noisy this benchmark is on this machine right now.
+    """
+    times = sorted(t / number * 1000 for t in timeit.Timer(func).repeat(repeat=repeat, number=number))
+    return times[0], times[len(times) // 2] / times[0] - 1
+
+def run_suite(stations=2, years=1.0, storage='legacy', days=30, repeat=5, work_dir=None):
+    """Time each hot path, returns {'config', 'environment', 'results': {name: ms}, 'spread': {name: fraction}}"""
+    from charger_scraper import ChargerScraper
+    from utilization_analysis import UtilizationAnalyzer
+
+    config = {'stations': stations, 'years': years, 'storage': storage, 'days': days, 'repeat': repeat}
+    timings = {}
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        db_path = os.path.join(tmp, 'history.db')
+        config['observations'] = generate_history(db_path, stations, years, storage=storage)
+        station = station_ids(stations)[0]
+
+        with FakeChargeHub() as hub:
+            scraper = ChargerScraper(db_path, url_template=hub.url_template)
+
+            # Parsing: every saved page through the configured extractor
+            fixtures = list(load_fixtures().values())
+            ms, spread = measure(lambda: [scraper.parse_status(html) for html in fixtures], 20, repeat)
+            timings['parse_status'] = (ms / len(fixtures), spread)
+
+            # Full scrape over loopback; alternating pages so every fetch is a changed page that gets parsed
+            pages = iter(['available.html', 'in_use.html'] * 1000)
+            def scrape():
+                hub.set(page=next(pages))
+                scraper.scrape_charger_status()
+            timings['scrape_charger_status'] = measure(scrape, 20, repeat)
+
+            # Reads before writes, so every read sees the same database
+            timings['get_latest_status'] = measure(lambda: scraper.get_latest_status(station), 200, repeat)
+            timings['get_status_history'] = measure(lambda: scraper.get_status_history(100, station), 50, repeat)
+
+            analyzer = UtilizationAnalyzer(db_path, station)
+            df = analyzer.load_data(days)
+            config['analyzed_samples'] = len(df) if df is not None else 0
+            timings['load_data'] = measure(lambda: analyzer.load_data(days), 1, repeat)
+            timings['generate_insights'] = measure(lambda: analyzer.generate_insights(df), 1, repeat)
+
+            timings['store_status'] = measure(lambda: scraper.store_status('Available', station), 20, repeat)
+            scraper.close()
+
+    return {
+        'config': config,
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine()
+        },
+        'results': {name: round(ms, 4) for name, (ms, _) in timings.items()},
+        'spread': {name: round(spread, 4) for name, (_, spread) in timings.items()}
+    }
+
+def best_of(first, second):
+    """Merge two reports of the same suite, keeping each benchmark's faster run"""
+    merged = dict(first, results={}, spread={})
+    for name, ms in first['results'].items():
+        report = second if second['results'].get(name, ms) < ms else first
+        merged['results'][name] = report['results'][name]
+        merged['spread'][name] = report['spread'][name]
+    return merged
+
+def compare(report, baseline, threshold):
+    """One row per benchmark with its change from the baseline and the slowdown it is allowed
+
+    Raw times are compared. A benchmark counts as a regression only when it
+    is slower by more than threshold plus the larger of its spread now and
+    its spread when the baseline was recorded, so noisy benchmarks need a
+    larger slowdown before they are flagged.
+    """
+    rows = []
+    for name, ms in report['results'].items():
+        base = baseline['results'].get(name)
+        change = ms / base - 1 if base else None
+        allowed = threshold + max(report['spread'].get(name, 0), baseline.get('spread', {}).get(name, 0))
+        rows.append({
+            'name': name,
+            'ms': ms,
+            'baseline_ms': base,
+            'change': change,
+            'allowed': allowed,
+            'regression': change is not None and change > allowed
+        })
+    return rows
+
+def print_results(report, rows=None):
+    """Print one line per benchmark, with the baseline comparison when there is one"""
+    config = report['config']
+    print(f"{config['stations']} station(s) x {config['years']} year(s), {config['observations']} observations, "
+          f"{config['storage']} storage, {config['analyzed_samples']} samples in {config['days']} days")
+    header = f"{'benchmark':24} {'ms/call':>10} {'spread':>7}"
+    if rows:
+        header += f" {'baseline':>10} {'change':>8} {'allowed':>8}"
+    print(header)
+    print('-' * len(header))
+    for row in rows or [{'name': name, 'ms': ms} for name, ms in report['results'].items()]:
+        line = f"{row['name']:24} {row['ms']:>10.4f} {report['spread'][row['name']]:>7.0%}"
+        if rows:
+            base = '-' if row['baseline_ms'] is None else f"{row['baseline_ms']:.4f}"
+            change = '-' if row['change'] is None else f"{row['change']:+.0%}"
+            line += f" {base:>10} {change:>8} {row['allowed']:>+8.0%}{'  REGRESSION' if row['regression'] else ''}"
+        print(line)
+
+def main():
+    """Main function for command-line usage"""
+    parser = argparse.ArgumentParser(description='Run the offline benchmark suite and compare it with a baseline')
+    parser.add_argument('--stations', type=int, default=2, help='Stations in the synthetic history (default: 2)')
+    parser.add_argument('--years', type=float, default=1.0, help='Years of history per station (default: 1)')
+    parser.add_argument('--storage', choices=['legacy', 'compact', 'intervals'], default='legacy',
+                        help='Storage format of the synthetic database (default: legacy)')
+    parser.add_argument('--days', type=int, default=30, help='Analysis window in days (default: 30)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing runs per benchmark, best is kept (default: 5)')
+    parser.add_argument('--baseline', type=str, default=BASELINE_FILE,
+                        help='Baseline JSON to compare with (default: benchmarks/baseline.json)')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Slowdown over the baseline, on top of measured noise, flagged as a regression (default: 0.25)')
+    parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+    parser.add_argument('--output', type=str, help='Output file for JSON results')
+
+    args = parser.parse_args()
+
+    # Per-call log lines would dominate the microbenchmarks
+    logging.disable(logging.INFO)
+
+    report = run_suite(args.stations, args.years, args.storage, args.days, args.repeat)
+
+    rows = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if any(report['config'].get(key) != value for key, value in baseline['config'].items()
+               if key not in DATASET_KEYS):
+            print(f"Baseline {args.baseline} was recorded with a different configuration; not comparing\n")
+        else:
+            rows = compare(report, baseline, args.threshold)
+            if any(row['regression'] for row in rows):
+                # A slowdown has to show up in a second run too, so a burst of load does not fail the check
+                print("Possible regression; running the suite again to confirm\n")
+                report = best_of(report, run_suite(args.stations, args.years, args.storage, args.days,
+                                                   args.repeat))
+                rows = compare(report, baseline, args.threshold)
+    print_results(report, rows)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    regressions = [row['name'] for row in rows or [] if row['regression']]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Stub ChargeHub server for tests and benchmarks
+Serves the saved fixture pages over local HTTP with configurable latency, errors and outages
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import hashlib
+import os
+import random
+import threading
+import time
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'chargehub')
+
+class FakeChargeHub:
+    """Local HTTP server standing in for ChargeHub station pages
+
+    Each request sleeps `latency` seconds, or `slow_latency` with probability
+    `slow_fraction`, and fails with HTTP 503 with probability `error_rate`.
+    Behaviour for the next requests can also be scripted with slow_next and
+    fail_next. Pages are fixtures chosen per station via `pages`, and carry an
+    ETag so conditional requests get a 304. `max_in_flight` records the most
+    requests being delayed at once.
+    """
+
+    def __init__(self, port=0, page='available.html', pages=None, latency=0.0, slow_fraction=0.0,
+                 slow_latency=5.0, error_rate=0.0, seed=None, fixtures_dir=FIXTURES_DIR):
+        self.port = port
+        self.page = page
+        self.pages = dict(pages or {})
+        self.latency = latency
+        self.slow_fraction = slow_fraction
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.fixtures_dir = fixtures_dir
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._script = []
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url_template(self):
+        """Station URL template for ChargerScraper(url_template=...)"""
+        return f"http://127.0.0.1:{self.port}/station?locId={{location_id}}"
+
+    def set(self, **options):
+        """Change latency, error or page options while serving, e.g. to start an outage"""
+        with self._lock:
+            for name, value in options.items():
+                if not hasattr(self, name):
+                    raise AttributeError(f"Unknown option: {name}")
+                setattr(self, name, value)
+
+    def slow_next(self, count=1, seconds=None):
+        """Delay the next count requests by seconds (default slow_latency)"""
+        with self._lock:
+            self._script.extend([('slow', seconds if seconds is not None else self.slow_latency)] * count)
+
+    def fail_next(self, count=1, status=503):
+        """Answer the next count requests with an error status"""
+        with self._lock:
+            self._script.extend([('fail', status)] * count)
+
+    def _plan(self, location_id):
+        """(delay, error status or None, page file) for one request"""
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            if self._script:
+                action, value = self._script.pop(0)
+                if action == 'slow':
+                    return value, None, self.pages.get(location_id, self.page)
+                return self.latency, value, None
+            slow = self._rng.random() < self.slow_fraction
+            error = 503 if self._rng.random() < self.error_rate else None
+            return (self.slow_latency if slow else self.latency), error, self.pages.get(location_id, self.page)
+
+    def _load_page(self, page):
+        with open(os.path.join(self.fixtures_dir, page), 'rb') as f:
+            return f.read()
+
+    def _handler(self):
+        hub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlsplit(self.path).query)
+                location_id = int(query['locId'][0]) if query.get('locId', [''])[0].isdigit() else None
+                delay, error, page = hub._plan(location_id)
+                try:
+                    if delay:
+                        time.sleep(delay)
+                finally:
+                    # Before replying, so a client never has its reply while the request still counts
+                    with hub._lock:
+                        hub.in_flight -= 1
+                try:
+                    if error:
+                        self.send_error(error)
+                        return
+                    body = hub._load_page(page)
+                    etag = f'"{hashlib.sha1(body).hexdigest()}"'
+                    if self.headers.get('If-None-Match') == etag:
+                        self.send_response(304)
+                        self.send_header('ETag', etag)
+                        self.end_headers()
+                        return
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/html; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up (timeout or a hedge won) before the reply
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """Serve in a background thread; port 0 picks a free port"""
+        self._server = ThreadingHTTPServer(('127.0.0.1', self.port), self._handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-chargehub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def main():
+    """Main function for command-line usage"""
+    parser = argparse.ArgumentParser(description='Serve saved ChargeHub pages with configurable latency and errors')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on (default: 8765)')
+    parser.add_argument('--page', type=str, default='available.html', help='Fixture page to serve')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds before each reply')
+    parser.add_argument('--slow-fraction', type=float, default=0.0, help='Fraction of replies that are slow')
+    parser.add_argument('--slow-latency', type=float, default=5.0, help='Seconds before a slow reply (default: 5)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+
+    args = parser.parse_args()
+
+    hub = FakeChargeHub(args.port, args.page, latency=args.latency, slow_fraction=args.slow_fraction,
+                        slow_latency=args.slow_latency, error_rate=args.error_rate).start()
+    print(f"Serving {args.page} at {hub.url_template}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        hub.stop()
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
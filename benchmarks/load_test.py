@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Load test for the API server
+Starts api_server.py against a synthetic database and a stub ChargeHub, drives concurrent
+widget reads and manual checks, and reports throughput and latency percentiles per endpoint
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_chargehub import FakeChargeHub
+from synthetic_history import generate_history
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Requests each client can make: (method, path)
+ENDPOINTS = {
+    'status': ('GET', '/api/status'),
+    'history': ('GET', '/api/history?limit=100'),
+    'changes': ('GET', '/api/changes?timeout=0'),
+    'check': ('POST', '/api/check?wait={check_wait}')
+}
+
+def parse_mix(text):
+    """'status:80,history:15,check:5' -> {'status': 80.0, ...}"""
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition(':')
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint {name!r}; choose from {', '.join(ENDPOINTS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(int(fraction * len(samples)), len(samples) - 1)] if samples else None
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class ApiServer:
+    """api_server.py in a subprocess, pointed at a database and a page source"""
+
+    def __init__(self, db_path, url_template, work_dir, check_min_interval=0.0):
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        env = dict(os.environ, PORT=str(self.port), DB_PATH=db_path, STATION_URL_TEMPLATE=url_template,
+                   CHECK_MIN_INTERVAL=str(check_min_interval))
+        self.log_path = os.path.join(work_dir, 'api_server.log')
+        self._log = open(self.log_path, 'w')
+        # Run from the work directory so the server's log files land there
+        self.process = subprocess.Popen([sys.executable, os.path.join(REPO_ROOT, 'api_server.py')],
+                                        cwd=work_dir, env=env, stdout=self._log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                requests.get(f"{self.base_url}/api/health", timeout=1)
+                return
+            except requests.exceptions.RequestException:
+                time.sleep(0.1)
+        raise RuntimeError(f"API server did not start; see {self.log_path}")
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self._log.close()
+
+def run_phase(base_url, mix, clients, duration, check_wait, think_time, seed=0):
+    """Drive the mix from concurrent clients for duration seconds, returns per-endpoint samples"""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client(index):
+        rng = random.Random(seed + index)
+        session = requests.Session()
+        while time.monotonic() < stop_at:
+            name = rng.choices(names, weights)[0]
+            method, path = ENDPOINTS[name]
+            started = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path.format(check_wait=check_wait), timeout=30)
+                failed = response.status_code >= 500
+            except requests.exceptions.RequestException:
+                failed = True
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                samples[name].append(elapsed)
+                errors[name] += failed
+            if think_time:
+                time.sleep(rng.uniform(0, 2 * think_time))
+        session.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = []
+    for name in names:
+        latencies = samples[name]
+        results.append({
+            'endpoint': name,
+            'requests': len(latencies),
+            'errors': errors[name],
+            'throughput': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.5), 1) if latencies else None,
+            'p95_ms': round(percentile(latencies, 0.95), 1) if latencies else None,
+            'p99_ms': round(percentile(latencies, 0.99), 1) if latencies else None,
+            'max_ms': round(max(latencies), 1) if latencies else None
+        })
+    return results
+
+def run_load_test(mix, clients=16, duration=10.0, hub_latency=0.5, check_wait=10.0, think_time=0.0,
+                  history_days=30, reads_only_first=True, seed=0):
+    """Start the stub hub and API server, then run the read-only and mixed phases"""
+    phases = {}
+    with tempfile.TemporaryDirectory() as tmp, FakeChargeHub(latency=hub_latency, seed=seed) as hub:
+        db_path = os.path.join(tmp, 'load.db')
+        generate_history(db_path, years=history_days / 365, seed=seed)
+        server = ApiServer(db_path, hub.url_template, tmp)
+        try:
+            server.wait_ready()
+            reads = {name: weight for name, weight in mix.items() if name != 'check'}
+            if reads_only_first and 'check' in mix and reads:
+                # The same reads without checks, to show what concurrent scrapes cost them
+                phases['reads'] = run_phase(server.base_url, reads, clients, duration, check_wait, think_time, seed)
+            phases['mixed'] = run_phase(server.base_url, mix, clients, duration, check_wait, think_time, seed)
+        finally:
+            server.stop()
+        hub_requests = hub.requests
+    return {
+        'config': {'mix': mix, 'clients': clients, 'duration': duration, 'hub_latency': hub_latency,
+                   'check_wait': check_wait, 'think_time': think_time},
+        'hub_requests': hub_requests,
+        'phases': phases
+    }
+
+def print_results(report):
+    """Print one table per phase"""
+    config = report['config']
+    print(f"{config['clients']} clients for {config['duration']}s per phase, "
+          f"ChargeHub latency {config['hub_latency']}s, {report['hub_requests']} page fetches")
+    for phase, rows in report['phases'].items():
+        print(f"\n{phase}")
+        header = (f"{'endpoint':10} {'requests':>9} {'errors':>7} {'req/s':>8}"
+                  f" {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        print(header)
+        print('-' * len(header))
+        for row in rows:
+            if not row['requests']:
+                print(f"{row['endpoint']:10} {0:>9}")
+                continue
+            print(f"{row['endpoint']:10} {row['requests']:>9} {row['errors']:>7} {row['throughput']:>8.1f}"
+                  f" {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}")
+
+def main():
+    """Main function for command-line usage"""
+    parser = argparse.ArgumentParser(description='Load test the API server against a stub ChargeHub')
+    parser.add_argument('--clients', type=int, default=16, help='Concurrent clients (default: 16)')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per phase (default: 10)')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('status:80,history:15,check:5'),
+                        help=f"Weighted endpoints from {', '.join(ENDPOINTS)} (default: status:80,history:15,check:5)")
+    parser.add_argument('--hub-latency', type=float, default=0.5,
+                        help='Seconds the stub ChargeHub takes per page (default: 0.5)')
+    parser.add_argument('--check-wait', type=float, default=10.0,
+                        help='Seconds a check request waits for its scrape (default: 10)')
+    parser.add_argument('--think-time', type=float, default=0.0,
+                        help='Mean pause between a client\'s requests in seconds (default: 0)')
+    parser.add_argument('--history-days', type=int, default=30, help='Days of synthetic history (default: 30)')
+    parser.add_argument('--mixed-only', action='store_true', help='Skip the read-only phase')
+    parser.add_argument('--output', type=str, help='Output file for JSON results')
+
+    args = parser.parse_args()
+
+    report = run_load_test(args.mix, args.clients, args.duration, args.hub_latency, args.check_wait,
+                           args.think_time, args.history_days, not args.mixed_only)
+    print_results(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
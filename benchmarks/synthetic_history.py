@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Synthetic charger history for benchmarks
+Generates irregularly polled status timelines and writes them as utilization databases of N stations x M years
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrate_storage import migrate
+from rollups import RollupWriter
+from storage import DEFAULT_LOCATION_ID, STATUS_CODES, STATUS_NAMES, LegacyStorage, from_epoch, get_storage
+
+def synthetic_timeline(years, interval=300, seed=0, end=None):
+    """Irregularly polled status observations with outages, as sorted (ts, codes) arrays
+
+    The timeline ends at epoch seconds `end` when given, so windows relative to now cover it.
+    Busy hours are derived after placing it, so they fall in the daytime (UTC) either way.
+    """
+    rng = np.random.default_rng(seed)
+    count = int(years * 365 * 86400 / interval)
+
+    # Jittered polling, with the occasional multi-hour outage
+    steps = interval + rng.integers(-30, 31, count)
+    outages = rng.random(count) < 0.002
+    steps[outages] += rng.integers(3600, 12 * 3600, outages.sum())
+    ts = np.cumsum(steps)
+    ts += 1_600_000_000 if end is None else int(end) - ts[-1]
+
+    # Status runs: busier in the daytime, mostly Available at night
+    hour = (ts // 3600) % 24
+    busy = rng.random(count) < np.where((hour >= 8) & (hour < 20), 0.6, 0.15)
+    codes = np.where(busy, STATUS_CODES['In Use'], STATUS_CODES['Available'])
+    codes[rng.random(count) < 0.01] = STATUS_CODES['Out of Order']
+    codes[rng.random(count) < 0.01] = STATUS_CODES['Unknown']
+
+    # Twice the polling rate in the daytime, which a per-sample mean over-weights
+    daytime = (hour >= 8) & (hour < 20)
+    ts = np.concatenate([ts, ts[daytime] - interval // 2])
+    codes = np.concatenate([codes, codes[daytime]])
+    order = np.argsort(ts, kind='stable')
+    return ts[order].astype('int64'), codes[order].astype('int64')
+
+def station_ids(stations):
+    """The default station first, then made-up IDs for the rest"""
+    return [DEFAULT_LOCATION_ID] + [1000 + i for i in range(1, stations)]
+
+def generate_history(db_path, stations=1, years=1.0, interval=300, seed=0, storage='legacy',
+                     rollups=False, end=None, batch_size=50000):
+    """Write a synthetic history database ending now, returns the number of observations"""
+    if os.path.exists(db_path):
+        raise FileExistsError(f"{db_path} already exists")
+    end = end if end is not None else time.time()
+
+    # Written in the original format, then migrated like a real database would be
+    conn = sqlite3.connect(db_path)
+    written = 0
+    try:
+        legacy = LegacyStorage()
+        with conn:
+            legacy.init_schema(conn)
+        for index, location_id in enumerate(station_ids(stations)):
+            ts, codes = synthetic_timeline(years, interval, seed + index, end)
+            for start in range(0, len(ts), batch_size):
+                rows = [
+                    (location_id, from_epoch(t), STATUS_NAMES[c])
+                    for t, c in zip(ts[start:start + batch_size].tolist(), codes[start:start + batch_size].tolist())
+                ]
+                with conn:
+                    legacy.write(conn, rows)
+            written += len(ts)
+    finally:
+        conn.close()
+
+    if storage != 'legacy':
+        migrate(db_path, drop_legacy=True, target=storage)
+    if rollups:
+        conn = sqlite3.connect(db_path)
+        try:
+            with conn:
+                RollupWriter().rebuild(conn, get_storage('auto', conn))
+        finally:
+            conn.close()
+    return written
+
+def main():
+    """Main function for command-line usage"""
+    parser = argparse.ArgumentParser(description='Generate a synthetic charger history database')
+    parser.add_argument('db', type=str, help='Database file to create')
+    parser.add_argument('--stations', type=int, default=1, help='Number of stations (default: 1)')
+    parser.add_argument('--years', type=float, default=1.0, help='Years of history per station (default: 1)')
+    parser.add_argument('--interval', type=int, default=300, help='Base polling interval in seconds (default: 300)')
+    parser.add_argument('--storage', choices=['legacy', 'compact', 'intervals'], default='legacy',
+                        help='Storage format (default: legacy)')
+    parser.add_argument('--rollups', action='store_true', help='Also build the hourly/daily rollup tables')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    written = generate_history(args.db, args.stations, args.years, args.interval, args.seed,
+                               args.storage, args.rollups)
+    print(f"Wrote {written} observations for {args.stations} station(s) to {args.db} "
+          f"({args.storage} storage) in {time.perf_counter() - started:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -4,14 +4,27 @@ Charger Status Scraper for University of Waterloo FLO Charger
 Monitors the 50kW FLO charger at ChargeHub LocID: 62901
 """
 
-import requests
-from bs4 import BeautifulSoup
-import sqlite3
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from urllib.parse import urlsplit
+import argparse
+import hashlib
 import logging
 import os
+import threading
+
+from database import get_manager
+from fetch_policy import CircuitOpenError, FetchPolicy
+from lazy_import import lazy_module
+import metrics
+from rollups import RolledUpStorage, has_rollups
+from status_extractors import get_extractor
+from storage import DB_WRITE_SECONDS, DEFAULT_LOCATION_ID, BufferedWriter, get_storage
+
+# Only needed once a page is fetched; reading the database does not pay for it
+requests = lazy_module('requests')
 
 # Configure logging
 logging.basicConfig(
@@ -24,10 +37,29 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+FETCH_SECONDS = metrics.histogram('charger_fetch_seconds', 'ChargeHub page fetch time by outcome', ['outcome'])
+PARSE_SECONDS = metrics.histogram('charger_parse_seconds', 'Status extraction time per changed page')
+DB_READ_SECONDS = metrics.histogram('charger_db_read_seconds', 'Time to read stored statuses', ['query'])
+OBSERVATIONS = metrics.counter('charger_observations_total', 'Stored observations by status', ['status'])
+TRANSITIONS = metrics.counter('charger_status_transitions_total',
+                              'Status changes between consecutive stored observations of a station',
+                              ['from_status', 'to_status'])
+
+STATION_URL_TEMPLATE = "https://chargehub.com/en/ev-charging-stations/canada/ontario/waterloo/university-of-waterloo/electric-car-stations-near-me?locId={location_id}"
+
 class ChargerScraper:
-    def __init__(self, db_path='charger_data.db'):
+    def __init__(self, db_path='charger_data.db', location_id=DEFAULT_LOCATION_ID,
+                 url_template=STATION_URL_TEMPLATE, pool_size=10, extractor='auto',
+                 storage='auto', buffer_size=None, flush_interval=60.0, rollups=None, fetch_policy=None):
         self.db_path = db_path
-        self.url = "https://chargehub.com/en/ev-charging-stations/canada/ontario/waterloo/university-of-waterloo/electric-car-stations-near-me?locId=62901"
+        self.db = get_manager(db_path)
+        self.location_id = location_id
+        self.url_template = url_template
+        self.url = self.station_url(location_id)
+        self.storage_format = storage
+        self.storage = None
+        # None keeps rollups up to date only if the database already has them
+        self.rollups = rollups
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
@@ -36,81 +68,163 @@ class ChargerScraper:
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
         }
+        self.extractor = get_extractor(extractor)
+        self.session = self._create_session(pool_size)
+        # Timeouts, hedging, retries and the per-host circuit breaker; room for a hedge per fetch
+        self.fetch_policy = fetch_policy or FetchPolicy(max_workers=2 * pool_size)
+        # Per-URL validators and last parsed status for conditional GETs
+        self._page_cache = {}
+        self._page_cache_lock = threading.Lock()
+        self._host_limits = {}
+        self._host_limits_lock = threading.Lock()
+        self._listeners = []
+        self._pre_store_hooks = []
+        # Last stored status per station, for counting transitions
+        self._last_status = {}
+        self.add_listener(self._count_observations)
         self.init_database()
+        # Optional group commit: observations are buffered and flushed together
+        self.writer = None
+        if buffer_size:
+            self.writer = BufferedWriter(self.db, self.storage, buffer_size, flush_interval)
+    
+    def _create_session(self, pool_size):
+        """Create a pooled HTTP session that keeps connections alive between polls"""
+        session = requests.Session()
+        session.headers.update(self.headers)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+    
+    def add_listener(self, callback):
+        """Call callback(rows) with (location_id, timestamp, status) rows after each store"""
+        self._listeners.append(callback)
+    
+    def add_pre_store_hook(self, callback):
+        """Call callback() in the storing thread just before each store"""
+        self._pre_store_hooks.append(callback)
+    
+    def _count_observations(self, rows):
+        """Listener feeding the observation and transition counters"""
+        for location_id, _, status in rows:
+            OBSERVATIONS.labels(status).inc()
+            previous = self._last_status.get(location_id)
+            if previous is not None and previous != status:
+                TRANSITIONS.labels(previous, status).inc()
+            self._last_status[location_id] = status
+    
+    def _before_store(self):
+        for callback in self._pre_store_hooks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Pre-store hook failed: {e}")
+    
+    def _notify(self, rows):
+        for callback in self._listeners:
+            try:
+                callback(rows)
+            except Exception as e:
+                logger.error(f"Status listener failed: {e}")
+    
+    def flush(self, block=True, only_if_due=False):
+        """Write any buffered observations, returns True on success"""
+        if self.writer is None:
+            return True
+        try:
+            if only_if_due:
+                self.writer.flush_if_due()
+            else:
+                self.writer.flush(block)
+            return True
+        except Exception as e:
+            logger.error(f"Database storage failed: {e}")
+            return False
+    
+    def close(self):
+        """Flush buffered observations and release pooled HTTP connections"""
+        self.flush()
+        self.fetch_policy.close()
+        self.session.close()
+    
+    def station_url(self, location_id):
+        """Build the ChargeHub page URL for a location ID"""
+        return self.url_template.format(location_id=location_id)
     
     def init_database(self):
-        """Initialize SQLite database with utilization table"""
+        """Initialize the SQLite database in the configured storage format"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS utilization (
-                    timestamp TEXT PRIMARY KEY,
-                    status TEXT CHECK(status IN ('Available', 'In Use', 'Out of Order', 'Unknown'))
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
-            logger.info("Database initialized successfully")
+            with self.db.transaction() as conn:
+                self.storage = get_storage(self.storage_format, conn, self.location_id)
+                if self.rollups or (self.rollups is None and has_rollups(conn)):
+                    self.storage = RolledUpStorage(self.storage)
+                self.storage.init_schema(conn)
+            
+            logger.info(f"Database initialized successfully ({self.storage.name} storage)")
         except Exception as e:
             logger.error(f"Database initialization failed: {e}")
             raise
     
-    def scrape_charger_status(self):
-        """Scrape the current charger status from ChargeHub"""
+    def scrape_charger_status(self, url=None, slots=None):
+        """Scrape the current charger status from ChargeHub; slots bounds concurrent requests to the host"""
+        url = url or self.url
         try:
-            logger.info("Fetching charger status from ChargeHub...")
-            response = requests.get(self.url, headers=self.headers, timeout=30)
+            with self._page_cache_lock:
+                cached = self._page_cache.get(url)
+            
+            conditional_headers = {}
+            if cached:
+                if cached['etag']:
+                    conditional_headers['If-None-Match'] = cached['etag']
+                if cached['last_modified']:
+                    conditional_headers['If-Modified-Since'] = cached['last_modified']
+            
+            logger.info(f"Fetching charger status from ChargeHub: {url}")
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                response = self.fetch_policy.get(self.session, url, slots=slots, headers=conditional_headers)
+                outcome = 'not_modified' if response.status_code == 304 else 'ok' if response.ok else 'error'
+            except CircuitOpenError:
+                outcome = 'short_circuit'
+                raise
+            finally:
+                FETCH_SECONDS.labels(outcome).observe(time.perf_counter() - started)
+            
+            if response.status_code == 304 and cached:
+                metrics.CACHE_REQUESTS.labels('page', 'hit').inc()
+                logger.info(f"Page not modified, reusing status: {cached['status']}")
+                return cached['status']
+            
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Look for Level 3 (DC fast charger) availability information
-            # This selector may need adjustment based on actual page structure
-            status_selectors = [
-                'div.availability',
-                'div[class*="availability"]',
-                'span[class*="available"]',
-                'div[class*="status"]',
-                '.charger-status',
-                '.dc-fast-charger'
-            ]
+            body_hash = hashlib.sha1(response.content).hexdigest()
+            if cached and cached['body_hash'] == body_hash:
+                metrics.CACHE_REQUESTS.labels('page', 'hit').inc()
+                status = cached['status']
+                logger.info(f"Page unchanged, reusing status: {status}")
+            else:
+                metrics.CACHE_REQUESTS.labels('page', 'miss').inc()
+                with PARSE_SECONDS.time():
+                    status = self.parse_status(response.text)
+                logger.info(f"Scraped status: {status}")
+            
+            with self._page_cache_lock:
+                self._page_cache[url] = {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'body_hash': body_hash,
+                    'status': status
+                }
             
-            status = 'Unknown'
-            
-            for selector in status_selectors:
-                elements = soup.select(selector)
-                for element in elements:
-                    text = element.get_text().strip().lower()
-                    if 'available' in text and '1/1' in text:
-                        status = 'Available'
-                        break
-                    elif 'available' in text and '0/1' in text:
-                        status = 'In Use'
-                        break
-                    elif 'out of order' in text or 'maintenance' in text:
-                        status = 'Out of Order'
-                        break
-                if status != 'Unknown':
-                    break
-            
-            # Fallback: look for any text containing availability info
-            if status == 'Unknown':
-                page_text = soup.get_text().lower()
-                if '1/1 available' in page_text or 'available' in page_text:
-                    # Try to determine if it's actually available or in use
-                    if '0/1' in page_text:
-                        status = 'In Use'
-                    else:
-                        status = 'Available'
-                elif 'out of order' in page_text or 'maintenance' in page_text:
-                    status = 'Out of Order'
-            
-            logger.info(f"Scraped status: {status}")
             return status
             
+        except CircuitOpenError as e:
+            # ChargeHub is failing; report the last known status instead of piling on more requests
+            status = cached['status'] if cached else 'Unknown'
+            logger.warning(f"{e}, using last known status: {status}")
+            return status
         except requests.exceptions.RequestException as e:
             logger.error(f"Network error while scraping: {e}")
             return 'Unknown'
@@ -118,87 +232,179 @@ class ChargerScraper:
             logger.error(f"Error parsing page: {e}")
             return 'Unknown'
     
-    def store_status(self, status):
+    def parse_status(self, html):
+        """Extract the charger status from a ChargeHub page"""
+        return self.extractor.extract(html)
+    
+    def store_status(self, status, location_id=None):
         """Store the charger status in the database"""
         try:
             timestamp = datetime.now(timezone.utc).isoformat()
+            location_id = location_id or self.location_id
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO utilization (timestamp, status)
-                VALUES (?, ?)
-            ''', (timestamp, status))
-            
-            conn.commit()
-            conn.close()
+            rows = [(location_id, timestamp, status)]
+            self._before_store()
+            if self.writer is not None:
+                self.writer.extend(rows)
+                logger.info(f"Buffered status: {status} at {timestamp}")
+            else:
+                with DB_WRITE_SECONDS.time(), self.db.transaction() as conn:
+                    self.storage.write(conn, rows)
+                logger.info(f"Stored status: {status} at {timestamp}")
             
-            logger.info(f"Stored status: {status} at {timestamp}")
+            self._notify(rows)
             return True
             
         except Exception as e:
             logger.error(f"Database storage failed: {e}")
             return False
     
-    def get_latest_status(self):
+    def get_latest_status(self, location_id=None):
         """Get the most recent status from the database"""
+        location_id = location_id or self.location_id
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT timestamp, status FROM utilization
-                ORDER BY timestamp DESC LIMIT 1
-            ''')
-            
-            result = cursor.fetchone()
-            conn.close()
-            
-            if result:
-                return {
-                    'timestamp': result[0],
-                    'status': result[1]
-                }
-            else:
-                return None
+            # Observations still waiting in the write buffer are the newest
+            if self.writer is not None:
+                pending = self.writer.latest(location_id)
+                if pending is not None:
+                    return pending
+            with DB_READ_SECONDS.labels('latest').time():
+                return self.storage.latest(self.db.connection(), location_id)
                 
         except Exception as e:
             logger.error(f"Error retrieving latest status: {e}")
             return None
     
-    def get_status_history(self, limit=100):
-        """Get historical status data"""
+    def get_status_history(self, limit=100, location_id=None, expand=False):
+        """Get historical status data (intervals storage returns intervals unless expanded)"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT timestamp, status FROM utilization
-                ORDER BY timestamp DESC LIMIT ?
-            ''', (limit,))
-            
-            results = cursor.fetchall()
-            conn.close()
-            
-            return [
-                {'timestamp': row[0], 'status': row[1]}
-                for row in results
-            ]
+            with DB_READ_SECONDS.labels('history').time():
+                return self.storage.history(self.db.connection(), location_id or self.location_id,
+                                            limit, expand)
             
         except Exception as e:
             logger.error(f"Error retrieving status history: {e}")
             return []
     
-    def run_single_check(self):
+    def iter_status_history(self, location_id=None, start=None, end=None, before=None, expand=False):
+        """Stream historical status data newest first, straight off a database cursor
+
+        start/end bound the range as [start, end); before is a keyset cursor,
+        the timestamp of the last row of the previous page.
+        """
+        return self.storage.iter_history(
+            self.db.connection(), location_id or self.location_id,
+            start=start, end=end, before=before, expand=expand
+        )
+    
+    def run_single_check(self, location_id=None):
         """Run a single status check and store result"""
-        status = self.scrape_charger_status()
-        success = self.store_status(status)
+        location_id = location_id or self.location_id
+        status = self.scrape_charger_status(self.station_url(location_id))
+        success = self.store_status(status, location_id)
         return success, status
+    
+    def _host_limit(self, url, per_host_limit):
+        """Get the semaphore bounding concurrent requests to a host, hedges included"""
+        host = urlsplit(url).netloc
+        with self._host_limits_lock:
+            limit = self._host_limits.get(host)
+            if limit is None:
+                limit = threading.BoundedSemaphore(per_host_limit)
+                self._host_limits[host] = limit
+            return limit
+    
+    def _scrape_station(self, location_id, per_host_limit):
+        """Scrape one station; each request to its host, hedges included, takes a concurrency slot"""
+        url = self.station_url(location_id)
+        status = self.scrape_charger_status(url, self._host_limit(url, per_host_limit))
+        return {
+            'status': status,
+            'timestamp': datetime.now(timezone.utc).isoformat()
+        }
+    
+    def scrape_stations(self, location_ids, max_workers=8, per_host_limit=4):
+        """Scrape several stations concurrently, keyed by location ID"""
+        location_ids = list(dict.fromkeys(location_ids))
+        if not location_ids:
+            return {}
+        
+        results = {}
+        workers = min(max_workers, len(location_ids))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scrape') as pool:
+            futures = {
+                location_id: pool.submit(self._scrape_station, location_id, per_host_limit)
+                for location_id in location_ids
+            }
+            for location_id, future in futures.items():
+                try:
+                    results[location_id] = future.result()
+                except Exception as e:
+                    logger.error(f"Error scraping station {location_id}: {e}")
+                    results[location_id] = {
+                        'status': 'Unknown',
+                        'timestamp': datetime.now(timezone.utc).isoformat()
+                    }
+        
+        return results
+    
+    def store_statuses(self, results):
+        """Store a sweep of per-station statuses in a single transaction"""
+        if not results:
+            return True
+        try:
+            rows = [
+                (location_id, result['timestamp'], result['status'])
+                for location_id, result in results.items()
+            ]
+            
+            self._before_store()
+            if self.writer is not None:
+                self.writer.extend(rows)
+                logger.info(f"Buffered {len(rows)} station statuses")
+            else:
+                with DB_WRITE_SECONDS.time(), self.db.transaction() as conn:
+                    self.storage.write(conn, rows)
+                logger.info(f"Stored {len(rows)} station statuses")
+            
+            self._notify(rows)
+            return True
+            
+        except Exception as e:
+            logger.error(f"Database storage failed: {e}")
+            return False
+    
+    def run_station_sweep(self, location_ids, max_workers=8, per_host_limit=4):
+        """Scrape several stations concurrently and store them in one batch"""
+        results = self.scrape_stations(location_ids, max_workers, per_host_limit)
+        success = self.store_statuses(results)
+        return success, results
 
 def main():
     """Main function for running the scraper"""
-    scraper = ChargerScraper()
+    parser = argparse.ArgumentParser(description='Scrape charger status from ChargeHub')
+    parser.add_argument('--stations', type=int, nargs='+', help='ChargeHub location IDs to sweep concurrently')
+    parser.add_argument('--max-workers', type=int, default=8, help='Concurrent fetches per sweep (default: 8)')
+    parser.add_argument('--per-host-limit', type=int, default=4, help='Concurrent fetches per host (default: 4)')
+    parser.add_argument('--extractor', choices=['auto', 'lxml', 'cascade'], default='auto',
+                        help='Page status extractor (default: auto)')
+    parser.add_argument('--storage', choices=['auto', 'legacy', 'compact', 'intervals'], default='auto',
+                        help='Storage format (default: auto, the newest format present)')
+    parser.add_argument('--db', type=str, default='charger_data.db', help='Database file path')
+    
+    args = parser.parse_args()
+    
+    scraper = ChargerScraper(args.db, pool_size=max(args.per_host_limit, 1), extractor=args.extractor,
+                             storage=args.storage)
+    
+    if args.stations:
+        logger.info(f"Starting sweep of {len(args.stations)} stations...")
+        success, results = scraper.run_station_sweep(
+            args.stations, args.max_workers, args.per_host_limit
+        )
+        for location_id, result in results.items():
+            logger.info(f"Station {location_id}: {result['status']}")
+        return 0 if success else 1
     
     logger.info("Starting charger status check...")
     success, status = scraper.run_single_check()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Background job queue for manual status checks
+Runs scrapes off the request thread, coalesces duplicate requests per station,
+enforces a minimum interval between checks of the same station and only
+checks configured stations, with a bounded number pending at once
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import logging
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+class CheckJobQueue:
+    """Queue of manual checks with per-station coalescing and rate limiting"""
+
+    def __init__(self, scraper, max_workers=2, min_interval=60.0, max_jobs=100, stations=(), max_pending=4):
+        self.scraper = scraper
+        self.min_interval = min_interval
+        self.max_jobs = max_jobs
+        # Only these stations may be checked, so requests cannot make up locations to scrape and store
+        self.stations = frozenset(stations) | {scraper.location_id}
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='check')
+        self._jobs = OrderedDict()
+        self._done_events = {}
+        self._inflight = {}
+        self._last_finished = {}
+        self._lock = threading.Lock()
+
+    def submit(self, location_id=None):
+        """Queue a check, returns (job, reason) where reason is 'queued', 'coalesced' or 'throttled'
+
+        The job is None when the station is not configured (reason 'unknown_station')
+        or max_pending checks are already queued or running (reason 'busy').
+        """
+        location_id = location_id or self.scraper.location_id
+        if location_id not in self.stations:
+            return None, 'unknown_station'
+        with self._lock:
+            job_id = self._inflight.get(location_id)
+            if job_id is not None:
+                return dict(self._jobs[job_id]), 'coalesced'
+
+            last = self._last_finished.get(location_id)
+            if last is not None and time.monotonic() - last[0] < self.min_interval and last[1] in self._jobs:
+                return dict(self._jobs[last[1]]), 'throttled'
+
+            if len(self._inflight) >= self.max_pending:
+                return None, 'busy'
+
+            job = {
+                'id': uuid.uuid4().hex,
+                'station': location_id,
+                'state': 'queued',
+                'status': None,
+                'error': None,
+                'created': datetime.now(timezone.utc).isoformat(),
+                'finished': None
+            }
+            self._jobs[job['id']] = job
+            self._done_events[job['id']] = threading.Event()
+            self._inflight[location_id] = job['id']
+            self._trim()
+
+        self._executor.submit(self._run, job['id'])
+        return dict(job), 'queued'
+
+    def _trim(self):
+        """Forget the oldest finished jobs beyond max_jobs"""
+        while len(self._jobs) > self.max_jobs:
+            oldest_id = next(iter(self._jobs))
+            if self._jobs[oldest_id]['state'] in ('queued', 'running'):
+                break
+            self._jobs.popitem(last=False)
+            self._done_events.pop(oldest_id, None)
+
+    def _run(self, job_id):
+        with self._lock:
+            job = self._jobs[job_id]
+            job['state'] = 'running'
+            location_id = job['station']
+
+        try:
+            success, status = self.scraper.run_single_check(location_id)
+            state, error = ('done', None) if success else ('failed', 'Status check failed')
+        except Exception as e:
+            logger.error(f"Error in status check job {job_id}: {e}")
+            state, status, error = 'failed', None, 'Internal server error'
+
+        with self._lock:
+            job.update(
+                state=state,
+                status=status,
+                error=error,
+                finished=datetime.now(timezone.utc).isoformat()
+            )
+            self._inflight.pop(location_id, None)
+            self._last_finished[location_id] = (time.monotonic(), job_id)
+            done = self._done_events.get(job_id)
+        if done is not None:
+            done.set()
+
+    def get(self, job_id):
+        """Snapshot of a job, or None if unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def wait(self, job_id, timeout):
+        """Wait up to timeout seconds for a job to finish, returns its snapshot"""
+        with self._lock:
+            done = self._done_events.get(job_id)
+        if done is not None:
+            done.wait(timeout)
+        return self.get(job_id)
+
+    def shutdown(self):
+        """Stop accepting jobs and wait for running ones"""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Shared SQLite connection manager for the charger status database
+Keeps one long-lived, WAL-mode connection per live thread and database file
+"""
+
+from contextlib import contextmanager
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+class ConnectionManager:
+    """Hands out thread-local connections to one SQLite database file"""
+
+    def __init__(self, db_path, busy_timeout=5.0, cache_size_kib=8192, cached_statements=256):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.cache_size_kib = cache_size_kib
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        # Owning thread -> connection, so connections of finished threads can be closed
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """Open a connection and apply the performance pragmas"""
+        # Statements are compiled once per connection and reused from sqlite3's
+        # statement cache, so long-lived connections avoid re-preparing SQL
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        # WAL lets the API read while the scheduler writes; NORMAL sync is
+        # durable across application crashes and only fsyncs at checkpoints
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kib)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout * 1000)}')
+        return conn
+
+    def connection(self):
+        """Get this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self._close_dead()
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._connections[threading.current_thread()] = conn
+        return conn
+
+    def _close_dead(self):
+        """Close the connections of threads that have finished
+
+        Servers that start a thread per request (Flask's threaded server) would
+        otherwise keep one open connection and its file descriptors per request.
+        """
+        with self._lock:
+            dead = [thread for thread in self._connections if not thread.is_alive()]
+            connections = [self._connections.pop(thread) for thread in dead]
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Error closing database connection: {e}")
+
+    @property
+    def open_connections(self):
+        """Number of connections currently open"""
+        with self._lock:
+            return len(self._connections)
+
+    @contextmanager
+    def transaction(self):
+        """Run a block in a transaction on this thread's connection"""
+        conn = self.connection()
+        with conn:
+            yield conn
+
+    def close(self):
+        """Close this thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            with self._lock:
+                self._connections.pop(threading.current_thread(), None)
+            conn.close()
+
+    def close_all(self):
+        """Close every connection; the last close checkpoints the WAL into the main file"""
+        with self._lock:
+            connections, self._connections = list(self._connections.values()), {}
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Error closing database connection: {e}")
+        self._local = threading.local()
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_manager(db_path='charger_data.db'):
+    """Get the process-wide connection manager for a database file"""
+    key = os.path.abspath(db_path)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = ConnectionManager(db_path)
+            _managers[key] = manager
+        return manager
+
+def close_all():
+    """Close the connections of every manager in this process"""
+    with _managers_lock:
+        managers = list(_managers.values())
+    for manager in managers:
+        manager.close_all()
+
+# Fold the WAL back into the database file on exit so the committed .db stays self-contained
+atexit.register(close_all)
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Fetch policy for ChargeHub requests
+Short timeouts, hedged second requests, retries with exponential backoff
+under a retry budget, and a per-host circuit breaker
+"""
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+import logging
+import random
+import threading
+import time
+
+from lazy_import import lazy_module
+import metrics
+
+requests = lazy_module('requests')
+
+logger = logging.getLogger(__name__)
+
+# Responses worth another attempt: the server is overloaded or briefly unavailable
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+FETCH_EVENTS = metrics.counter('charger_fetch_events_total',
+                               'Fetch policy requests, attempts, retries, hedges, failures and short circuits',
+                               ['event'])
+
+class CircuitOpenError(Exception):
+    """Raised instead of fetching while a host's circuit breaker is open"""
+
+class LatencyTracker:
+    """Recent response times of one host"""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, fraction):
+        """Latency below which the given fraction of recent responses arrived"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(int(fraction * len(samples)), len(samples) - 1)]
+
+class RetryBudget:
+    """Token bucket that caps retries and hedges at a fraction of the request rate
+
+    Every request deposits `ratio` tokens and every extra attempt spends one,
+    so during an outage retries add at most `ratio` more load. `reserve` is
+    both the starting balance and the cap, allowing a burst of retries after
+    a quiet period.
+    """
+
+    def __init__(self, ratio=0.2, reserve=10):
+        self.ratio = ratio
+        self.reserve = reserve
+        self._tokens = float(reserve)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self.reserve)
+
+    def withdraw(self):
+        """Spend a token, returns False when the budget is exhausted"""
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+class CircuitBreaker:
+    """Opens after consecutive failures; lets a single trial through once reset_timeout has passed"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a request may go out now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                # The caller is the trial; everyone else waits for its outcome
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit opened after {self.failures} consecutive failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+class FetchPolicy:
+    """Bounded-latency GETs: every call returns or raises within `deadline` seconds
+
+    Each attempt uses short connect/read timeouts. If the first request has
+    not answered after the host's hedge_percentile latency (or a fixed
+    hedge_delay), a second identical request is sent and the first response
+    wins. Connection errors, timeouts and RETRY_STATUSES are retried with
+    jittered exponential backoff while the retry budget and deadline allow.
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10.0, deadline=20.0, max_attempts=3,
+                 backoff_base=0.5, backoff_max=4.0, hedge_delay=None, hedge_percentile=0.95,
+                 hedge_min_samples=20, initial_hedge_delay=2.0, retry_budget=None,
+                 failure_threshold=5, reset_timeout=60.0, max_workers=16):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_delay = hedge_delay
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.initial_hedge_delay = initial_hedge_delay
+        self.budget = retry_budget or RetryBudget()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.stats = {'requests': 0, 'attempts': 0, 'retries': 0, 'hedges': 0, 'hedge_wins': 0,
+                      'failures': 0, 'short_circuits': 0}
+        self._hosts = {}
+        self._hosts_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._events = {name: FETCH_EVENTS.labels(name) for name in self.stats}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch')
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+        self._events[name].inc()
+
+    def _host(self, url):
+        """(breaker, latency tracker) of a URL's host"""
+        host = urlsplit(url).netloc
+        with self._hosts_lock:
+            entry = self._hosts.get(host)
+            if entry is None:
+                entry = (CircuitBreaker(self.failure_threshold, self.reset_timeout), LatencyTracker())
+                self._hosts[host] = entry
+            return entry
+
+    def breaker(self, url):
+        """Circuit breaker of a URL's host"""
+        return self._host(url)[0]
+
+    def _hedge_after(self, latencies):
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        if len(latencies) < self.hedge_min_samples:
+            return self.initial_hedge_delay
+        return latencies.percentile(self.hedge_percentile)
+
+    def _timed_get(self, session, url, latencies, deadline, kwargs, slots=None, held=False):
+        """One request, holding one of the caller's slots (unless already held) while it runs"""
+        if slots is not None and not held and not slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            raise requests.exceptions.Timeout(f"No free slot to fetch {url} within {self.deadline}s")
+        try:
+            self._count('attempts')
+            read_timeout = max(min(self.read_timeout, deadline - time.monotonic()), 0.001)
+            started = time.monotonic()
+            response = session.get(url, timeout=(self.connect_timeout, read_timeout), **kwargs)
+            if response.status_code not in RETRY_STATUSES:
+                latencies.add(time.monotonic() - started)
+            return response
+        finally:
+            if slots is not None:
+                slots.release()
+
+    def _hedged_get(self, session, url, latencies, deadline, kwargs, slots=None):
+        """One attempt, plus a hedge if the first request is slow; the first response wins
+
+        The hedge needs a free slot of its own, so it never exceeds the caller's concurrency limit.
+        """
+        futures = [self._executor.submit(self._timed_get, session, url, latencies, deadline, kwargs, slots)]
+
+        hedge_after = min(self._hedge_after(latencies), max(deadline - time.monotonic(), 0))
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done and time.monotonic() < deadline and (slots is None or slots.acquire(blocking=False)):
+            if self.budget.withdraw():
+                self._count('hedges')
+                futures.append(self._executor.submit(self._timed_get, session, url, latencies, deadline, kwargs,
+                                                     slots, True))
+            elif slots is not None:
+                slots.release()
+
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(deadline - time.monotonic(), 0),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                # The losing requests finish in the background, bounded by their own timeouts
+                raise requests.exceptions.Timeout(f"No response from {url} within {self.deadline}s")
+            for future in done:
+                try:
+                    response = future.result()
+                except requests.exceptions.RequestException as e:
+                    error = e
+                    continue
+                if future is not futures[0]:
+                    self._count('hedge_wins')
+                return response
+        raise error
+
+    def get(self, session, url, slots=None, **kwargs):
+        """GET url through session; raises CircuitOpenError while the host's circuit is open
+
+        slots is an optional semaphore bounding concurrent requests (e.g. per host);
+        every attempt and hedge holds one while it is in flight.
+        """
+        breaker, latencies = self._host(url)
+        if not breaker.allow():
+            self._count('short_circuits')
+            raise CircuitOpenError(f"Circuit open for {urlsplit(url).netloc}")
+
+        self._count('requests')
+        self.budget.deposit()
+        deadline = time.monotonic() + self.deadline
+        attempt = 1
+        while True:
+            try:
+                response = self._hedged_get(session, url, latencies, deadline, kwargs, slots)
+                failure = f"HTTP {response.status_code}" if response.status_code in RETRY_STATUSES else None
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                response = None
+                failure = e
+            except Exception:
+                # Not the host's fault (bad URL, redirect loop...); don't leave a trial pending
+                breaker.record_success()
+                raise
+
+            if failure is None:
+                breaker.record_success()
+                return response
+
+            breaker.record_failure()
+            self._count('failures')
+            delay = min(self.backoff_base * 2 ** (attempt - 1), self.backoff_max) * random.uniform(0.5, 1.0)
+            if (attempt >= self.max_attempts or breaker.state == CircuitBreaker.OPEN
+                    or time.monotonic() + delay >= deadline or not self.budget.withdraw()):
+                # Out of attempts: hand back the last error response, or raise the last error
+                if response is not None:
+                    return response
+                raise failure
+
+            logger.warning(f"Fetch attempt {attempt} failed ({failure}), retrying in {delay:.1f}s")
+            self._count('retries')
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        """Stop the worker threads once in-flight requests finish"""
+        self._executor.shutdown(wait=False)
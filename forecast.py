@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Availability forecasts per station and 15-minute slot of the week
+Folds stored history and new observations into occupancy and transition
+tables, and answers predictions from precomputed per-slot lookups
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+import argparse
+import logging
+import threading
+import time
+
+from lazy_import import lazy_module
+from storage import DEFAULT_LOCATION_ID, MAX_GAP_SECONDS, STATUS_CODES, from_epoch, to_epoch
+from utilization_analysis import ANALYSIS_SECONDS, DAY_NAMES, UtilizationAnalyzer, split_spans, timeline_arrays
+
+np = lazy_module('numpy')
+
+logger = logging.getLogger(__name__)
+
+SLOT_SECONDS = 900
+SLOTS_PER_DAY = 86400 // SLOT_SECONDS
+SLOTS_PER_WEEK = 7 * SLOTS_PER_DAY
+# 1970-01-01 was a Thursday; slot 0 is Monday 00:00 UTC
+EPOCH_SLOT_OFFSET = 3 * SLOTS_PER_DAY
+
+AVAILABLE = STATUS_CODES['Available']
+OCCUPIED = [STATUS_CODES['In Use'], STATUS_CODES['Out of Order']]
+UNKNOWN = STATUS_CODES['Unknown']
+
+def slot_of(ts):
+    """Slot of the week for epoch seconds (scalar or array)"""
+    return (np.asarray(ts) // SLOT_SECONDS + EPOCH_SLOT_OFFSET) % SLOTS_PER_WEEK
+
+def slot_label(slot):
+    """Weekday and start time of a slot"""
+    minutes = (slot % SLOTS_PER_DAY) * SLOT_SECONDS // 60
+    return DAY_NAMES[slot // SLOTS_PER_DAY], f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+class SlotModel:
+    """Seconds per status and status transitions for each slot of the week"""
+
+    def __init__(self, max_gap=MAX_GAP_SECONDS):
+        self.max_gap = max_gap
+        self.occupancy = np.zeros((SLOTS_PER_WEEK, len(STATUS_CODES)))
+        self.transitions = np.zeros((SLOTS_PER_WEEK, len(STATUS_CODES), len(STATUS_CODES)))
+        self.last = None
+        self._lookup = None
+
+    def fold(self, ts, codes):
+        """Add sorted observations newer than the last folded one"""
+        ts = np.asarray(ts, dtype='int64')
+        codes = np.asarray(codes, dtype='int64')
+        if self.last is not None:
+            newer = ts > self.last[0]
+            ts = np.concatenate([[self.last[0]], ts[newer]])
+            codes = np.concatenate([[self.last[1]], codes[newer]])
+        if len(ts) == 0:
+            return
+        self.last = (int(ts[-1]), int(codes[-1]))
+        if len(ts) < 2:
+            return
+
+        bucket, seconds, status = split_spans(ts, codes, SLOT_SECONDS, self.max_gap)
+        np.add.at(self.occupancy, (slot_of(bucket * SLOT_SECONDS), status), seconds)
+
+        # A transition belongs to the slot it was observed in
+        contiguous = np.diff(ts) <= self.max_gap
+        np.add.at(
+            self.transitions,
+            (slot_of(ts[1:][contiguous]), codes[:-1][contiguous], codes[1:][contiguous]),
+            1
+        )
+        self._lookup = None
+
+    def _build_lookup(self):
+        """Probability available and expected wait per slot, recomputed after folds"""
+        known = self.occupancy.copy()
+        known[:, UNKNOWN] = 0
+        tracked = known.sum(axis=1)
+        occupied = tracked - known[:, AVAILABLE]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            probability = np.where(tracked > 0, known[:, AVAILABLE] / tracked, np.nan)
+
+            # Rate at which an occupied charger frees up, per second, in each slot
+            freed = self.transitions[:, OCCUPIED, AVAILABLE].sum(axis=1)
+            rate = np.where(occupied > 0, freed / occupied, 0.0)
+
+        # Piecewise-constant hazard: survival through a slot is exp(-rate * slot)
+        # and the expected time spent waiting in it is (1 - survival) / rate
+        survive = np.exp(-rate * SLOT_SECONDS)
+        spent = np.where(rate > 0, (1 - survive) / np.where(rate > 0, rate, 1), SLOT_SECONDS)
+
+        # Walk one week ahead from every start slot at once
+        ahead = (np.arange(SLOTS_PER_WEEK)[:, None] + np.arange(SLOTS_PER_WEEK)[None, :]) % SLOTS_PER_WEEK
+        log_survive = np.log(np.maximum(survive, 1e-300))[ahead]
+        before = np.exp(np.cumsum(log_survive, axis=1) - log_survive)
+        wait = (before * spent[ahead]).sum(axis=1)
+
+        # Still occupied after a week means no observed way out; no estimate
+        still_occupied = np.exp(log_survive.sum(axis=1))
+        wait = np.where(still_occupied > 0.5, np.nan, wait)
+        self._lookup = {'probability': probability, 'wait': wait, 'tracked': tracked}
+
+    def activity(self):
+        """Observed status changes and hours tracked in each slot"""
+        changes = self.transitions.sum(axis=(1, 2)) - np.trace(self.transitions, axis1=1, axis2=2)
+        return changes, self.occupancy.sum(axis=1) / 3600
+
+    def predict(self, ts):
+        """Prediction for the slot containing epoch seconds ts"""
+        if self._lookup is None:
+            self._build_lookup()
+        slot = int(slot_of(ts))
+        probability = self._lookup['probability'][slot]
+        wait = self._lookup['wait'][slot]
+        weekday, start = slot_label(slot)
+        return {
+            'slot': {'index': slot, 'weekday': weekday, 'start': start, 'minutes': SLOT_SECONDS // 60},
+            'probability_available': None if np.isnan(probability) else round(float(probability), 3),
+            'wait_if_occupied_minutes': None if np.isnan(wait) else round(float(wait) / 60, 1),
+            'expected_wait_minutes': (
+                None if np.isnan(wait) or np.isnan(probability)
+                else round(float((1 - probability) * wait) / 60, 1)
+            ),
+            'observed_hours': round(float(self._lookup['tracked'][slot]) / 3600, 2)
+        }
+
+class AvailabilityForecaster:
+    """Slot models per station, built and refreshed on a background thread
+
+    self._lock only guards the dictionaries; each station's model has its own
+    lock, so a build or catch-up never stalls stores or lookups elsewhere.
+    """
+
+    def __init__(self, db_path, history_days=180, refresh_interval=60.0, chunk_size=50000):
+        self.db_path = db_path
+        self.history_days = history_days
+        self.refresh_interval = refresh_interval
+        self.chunk_size = chunk_size
+        self._models = {}
+        self._refreshed = {}
+        self._updates = {}
+        self._station_locks = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='forecast')
+
+    def _station_lock(self, location_id):
+        with self._lock:
+            return self._station_locks.setdefault(location_id, threading.Lock())
+
+    def _fold_history(self, model, location_id, cutoff_date, model_lock=None):
+        """Fold stored observations newer than the cutoff, chunk by chunk; the lock is held per fold only"""
+        analyzer = UtilizationAnalyzer(self.db_path, location_id)
+        conn = analyzer.db.connection()
+        for frame in analyzer.iter_sample_chunks(conn, cutoff_date, self.chunk_size):
+            if not frame.empty:
+                ts, codes = timeline_arrays(frame)
+                with model_lock or nullcontext():
+                    model.fold(ts, codes)
+
+    def _update(self, location_id):
+        """Build a station's model, or catch it up with rows written by other processes (e.g. the scheduler)"""
+        try:
+            with self._lock:
+                model = self._models.get(location_id)
+            if model is None:
+                # Built privately and swapped in when complete
+                model = SlotModel()
+                started = time.perf_counter()
+                with ANALYSIS_SECONDS.labels('forecast_model').time():
+                    self._fold_history(model, location_id, datetime.now() - timedelta(days=self.history_days))
+                logger.info(f"Built forecast model for station {location_id} "
+                            f"in {time.perf_counter() - started:.2f}s")
+                with self._lock:
+                    self._models[location_id] = model
+            elif model.last is not None:
+                # An index seek past the last folded row. Start a day early so naive
+                # timestamps in any local zone are covered; fold skips repeats.
+                self._fold_history(model, location_id, datetime.fromtimestamp(model.last[0]) - timedelta(days=1),
+                                   self._station_lock(location_id))
+            with self._lock:
+                self._refreshed[location_id] = time.monotonic()
+        except Exception as e:
+            logger.error(f"Error updating forecast model for station {location_id}: {e}")
+        finally:
+            with self._lock:
+                self._updates.pop(location_id, None)
+
+    def _schedule(self, location_id):
+        """Queue a build or refresh unless one is pending, returns (model or None, pending update)"""
+        with self._lock:
+            model = self._models.get(location_id)
+            stale = model is None or time.monotonic() - self._refreshed.get(location_id, 0) >= self.refresh_interval
+            update = self._updates.get(location_id)
+            if stale and update is None:
+                update = self._executor.submit(self._update, location_id)
+                self._updates[location_id] = update
+            return model, update
+
+    def warm(self, location_id=DEFAULT_LOCATION_ID):
+        """Start building a station's model in the background"""
+        self._schedule(location_id)
+
+    def _model(self, location_id, wait):
+        """A station's model; without wait, None until its first build finishes"""
+        model, update = self._schedule(location_id)
+        if model is None and wait and update is not None:
+            update.result()
+            with self._lock:
+                model = self._models.get(location_id)
+        return model
+
+    def on_store(self, rows):
+        """Scraper listener: fold new observations into stations that already have a model"""
+        for location_id, timestamp, status in sorted(rows, key=lambda row: (row[0], row[1])):
+            with self._lock:
+                model = self._models.get(location_id)
+            if model is not None:
+                with self._station_lock(location_id):
+                    model.fold([to_epoch(timestamp)], [STATUS_CODES.get(status, UNKNOWN)])
+
+    def activity(self, location_id=DEFAULT_LOCATION_ID, wait=True):
+        """(changes, hours) per slot of the week for a station"""
+        model = self._model(location_id, wait) or SlotModel()
+        with self._station_lock(location_id):
+            return model.activity()
+
+    def predict(self, location_id=DEFAULT_LOCATION_ID, at=None, wait=True):
+        """Availability prediction for a station at a time (default now)"""
+        ts = to_epoch(at) if at else int(time.time())
+        model = self._model(location_id, wait)
+        ready = model is not None
+        with self._station_lock(location_id):
+            prediction = (model or SlotModel()).predict(ts)
+        return {'station': location_id, 'at': from_epoch(ts), 'ready': ready, **prediction}
+
+def main():
+    """Main function for command-line usage"""
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Forecast charger availability by slot of the week')
+    parser.add_argument('--db', type=str, default='charger_data.db', help='Database file path')
+    parser.add_argument('--station', type=int, default=DEFAULT_LOCATION_ID, help='Location ID to forecast')
+    parser.add_argument('--history-days', type=int, default=180, help='Days of history to learn from (default: 180)')
+    parser.add_argument('--hours', type=int, default=24, help='Hours ahead to forecast (default: 24)')
+
+    args = parser.parse_args()
+
+    forecaster = AvailabilityForecaster(args.db, history_days=args.history_days)
+    now = int(time.time())
+    print(f"{'Slot (UTC)':18} {'Available':>10} {'Expected wait':>14} {'Observed':>9}")
+    for ts in range(now, now + args.hours * 3600, 3600):
+        prediction = forecaster.predict(args.station, from_epoch(ts))
+        slot = prediction['slot']
+        probability = prediction['probability_available']
+        wait = prediction['expected_wait_minutes']
+        print(f"{slot['weekday'][:3]} {slot['start']:14} "
+              f"{'-' if probability is None else f'{probability:.0%}':>10} "
+              f"{'-' if wait is None else f'{wait:.0f} min':>14} "
+              f"{prediction['observed_hours']:>8}h")
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
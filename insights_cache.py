@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of utilization reports
+Keyed by station, window, parameters and a watermark of the analyzed rows,
+so a report is only recomputed after new data arrives
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Bump when the report layout changes so stale entries are never served
+CACHE_VERSION = 2
+
+def _int_keys(pairs):
+    """JSON object hook restoring the integer keys (hours, station IDs) that JSON turns into strings"""
+    return {int(key) if key.isdigit() else key: value for key, value in pairs}
+
+class InsightsCache:
+    """Least-recently-used report files in a directory next to the database"""
+
+    def __init__(self, db_path, cache_dir=None, max_entries=128):
+        self.cache_dir = cache_dir or f"{db_path}.insights"
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def make_key(self, **params):
+        """Stable key for a report's parameters"""
+        payload = json.dumps({'version': CACHE_VERSION, **params}, sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get_raw(self, key):
+        """Cached report as JSON text, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                payload = f.read()
+            # The modification time doubles as the LRU clock
+            os.utime(path)
+            return payload
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.error(f"Error reading insights cache: {e}")
+            return None
+
+    def get(self, key):
+        """Cached report, or None on a miss"""
+        payload = self.get_raw(key)
+        return json.loads(payload, object_pairs_hook=_int_keys) if payload is not None else None
+
+    def put(self, key, report):
+        """Store a report, evicting the least recently used entries beyond max_entries"""
+        # Strict JSON: NaN would be rejected by JSON.parse and iOS Shortcuts
+        payload = json.dumps(report, allow_nan=False)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write then rename so readers never see a partial file
+            tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(payload)
+            os.replace(tmp_path, self._path(key))
+            self._evict()
+        except OSError as e:
+            logger.error(f"Error writing insights cache: {e}")
+        return payload
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    entries.append((os.stat(path).st_mtime_ns, path))
+                except OSError:
+                    continue
+            entries.sort()
+            for _, path in entries[:max(len(entries) - self.max_entries, 0)]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def clear(self):
+        """Drop every cached report"""
+        with self._lock:
+            if not os.path.isdir(self.cache_dir):
+                return
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+    def report_key(self, analyzer, days_back, sections):
+        """Key of a station's report; includes the watermark of the rows it covers"""
+        # Streaming (chunk_size) only changes how a report is computed, not its content
+        return self.make_key(
+            station=analyzer.location_id,
+            days=days_back,
+            sections=sorted(sections),
+            watermark=analyzer.watermark(days_back)
+        )
+
+    def report_raw(self, analyzer, days_back, sections, chunk_size=None):
+        """(key, JSON text) of a station's report, computing and caching it on a miss"""
+        key = self.report_key(analyzer, days_back, sections)
+        payload = self.get_raw(key)
+        metrics.CACHE_REQUESTS.labels('insights', 'miss' if payload is None else 'hit').inc()
+        if payload is None:
+            logger.info(f"Insights cache miss for station {analyzer.location_id}, {days_back} days")
+            payload = self.put(key, analyzer.build_report(days_back, sections, chunk_size))
+        return key, payload
+
+    def report(self, analyzer, days_back, sections, chunk_size=None):
+        """A station's report, computed only when the cached one is missing or stale"""
+        _, payload = self.report_raw(analyzer, days_back, sections, chunk_size)
+        return json.loads(payload, object_pairs_hook=_int_keys)
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Deferred imports for heavy optional modules
+Lets entry points that never touch pandas, numpy, requests or BeautifulSoup
+start without paying for their import
+"""
+
+import importlib
+import threading
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+def lazy_module(name):
+    """Module proxy that defers `import name` until it is first used"""
+    return LazyModule(name)
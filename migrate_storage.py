@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Migration tool for the compact and intervals storage formats
+Copies legacy utilization/station_utilization rows into the compact samples
+table, optionally folds samples into change-point intervals, and replaces
+utilization with a read-only view
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+
+from storage import (
+    DEFAULT_LOCATION_ID, STATUS_CODES, CompactStorage, IntervalStorage,
+    compress_samples, table_exists, to_epoch
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 10000
+
+# Tables of the legacy format, renamed with BACKUP_SUFFIX unless dropped
+LEGACY_TABLES = ('utilization', 'station_utilization')
+BACKUP_SUFFIX = '_legacy'
+
+# Read-only views so the widget and workflow queries keep working without legacy tables
+COMPAT_VIEW_SQL = {
+    'compact': '''
+        CREATE VIEW IF NOT EXISTS utilization AS
+        SELECT strftime('%Y-%m-%dT%H:%M:%S+00:00', s.ts, 'unixepoch') AS timestamp,
+               c.name AS status
+        FROM samples s JOIN status_codes c ON c.code = s.status
+        WHERE s.station_id = {location_id}
+    ''',
+    'intervals': '''
+        CREATE VIEW IF NOT EXISTS utilization AS
+        SELECT strftime('%Y-%m-%dT%H:%M:%S+00:00', i.end_ts, 'unixepoch') AS timestamp,
+               c.name AS status
+        FROM status_intervals i JOIN status_codes c ON c.code = i.status
+        WHERE i.station_id = {location_id}
+    '''
+}
+
+def _copy_rows(conn, select_sql, params, to_row):
+    """Stream legacy rows into samples in batches, returns the number copied"""
+    copied = 0
+    source = conn.execute(select_sql, params)
+    while True:
+        rows = source.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        conn.executemany('''
+            INSERT OR REPLACE INTO samples (station_id, ts, status)
+            VALUES (?, ?, ?)
+        ''', [to_row(row) for row in rows])
+        copied += len(rows)
+    return copied
+
+def _build_intervals(conn):
+    """Fold the compact samples into status_intervals, returns the number of intervals"""
+    IntervalStorage().init_schema(conn)
+    conn.execute('DELETE FROM status_intervals')
+    source = conn.execute('SELECT station_id, ts, status FROM samples ORDER BY station_id, ts')
+    samples = (row for rows in iter(lambda: source.fetchmany(BATCH_SIZE), []) for row in rows)
+
+    count = 0
+    batch = []
+    for interval in compress_samples(samples):
+        batch.append(interval)
+        if len(batch) >= BATCH_SIZE:
+            count += _insert_intervals(conn, batch)
+            batch = []
+    count += _insert_intervals(conn, batch)
+    return count
+
+def _insert_intervals(conn, intervals):
+    conn.executemany('''
+        INSERT INTO status_intervals (station_id, start_ts, end_ts, status, samples)
+        VALUES (?, ?, ?, ?, ?)
+    ''', intervals)
+    return len(intervals)
+
+def migrate(db_path, primary_location_id=DEFAULT_LOCATION_ID, drop_legacy=False, vacuum=False,
+            target='compact'):
+    """Migrate a database to the compact or intervals format, returns the number of rows copied"""
+    size_before = os.path.getsize(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            CompactStorage().init_schema(conn)
+
+            copied = 0
+            if table_exists(conn, 'utilization'):
+                copied += _copy_rows(
+                    conn,
+                    'SELECT timestamp, status FROM utilization',
+                    (),
+                    lambda row: (primary_location_id, to_epoch(row[0]), STATUS_CODES[row[1]])
+                )
+            if table_exists(conn, 'station_utilization'):
+                copied += _copy_rows(
+                    conn,
+                    'SELECT location_id, timestamp, status FROM station_utilization',
+                    (),
+                    lambda row: (row[0], to_epoch(row[1]), STATUS_CODES[row[2]])
+                )
+
+            if target == 'intervals':
+                intervals = _build_intervals(conn)
+                logger.info(f"Folded samples into {intervals} intervals")
+
+            # The legacy tables always make way for the view: components that
+            # query utilization directly must see rows written after the migration
+            for table in LEGACY_TABLES:
+                if not table_exists(conn, table):
+                    continue
+                if drop_legacy:
+                    conn.execute(f'DROP TABLE {table}')
+                else:
+                    backup = f'{table}{BACKUP_SUFFIX}'
+                    if table_exists(conn, backup):
+                        raise RuntimeError(f"Cannot back up {table}: {backup} already exists")
+                    conn.execute(f'ALTER TABLE {table} RENAME TO {backup}')
+                    logger.info(f"Kept the legacy {table} table as {backup}")
+            if drop_legacy and target == 'intervals':
+                conn.execute('DROP TABLE samples')
+            conn.execute('DROP VIEW IF EXISTS utilization')
+            conn.execute(COMPAT_VIEW_SQL[target].format(location_id=int(primary_location_id)))
+
+        if vacuum:
+            conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+    size_after = os.path.getsize(db_path)
+    logger.info(f"Migrated {copied} rows to {target} storage "
+                f"({size_before / 1024:.1f} KiB -> {size_after / 1024:.1f} KiB)")
+    return copied
+
+def main():
+    """Main function for command-line usage"""
+    parser = argparse.ArgumentParser(description='Migrate charger_data.db to a newer storage format')
+    parser.add_argument('--db', type=str, default='charger_data.db', help='Database file path')
+    parser.add_argument('--format', choices=['compact', 'intervals'], default='compact',
+                        help='Target storage format (default: compact)')
+    parser.add_argument('--primary-location', type=int, default=DEFAULT_LOCATION_ID,
+                        help=f'Location ID of rows in the legacy utilization table (default: {DEFAULT_LOCATION_ID})')
+    parser.add_argument('--drop-legacy', action='store_true',
+                        help='Drop the older tables instead of keeping them as *_legacy backups')
+    parser.add_argument('--vacuum', action='store_true', help='VACUUM afterwards to reclaim space')
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        logger.error(f"Database not found: {args.db}")
+        return 1
+
+    migrate(args.db, args.primary_location, args.drop_legacy, args.vacuum, args.format)
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Incremental hourly and daily rollups of charger status
+Keeps per-station sample counts and seconds spent in each status per UTC
+hour and day, updated in the same transaction as every stored observation
+"""
+
+import argparse
+import logging
+import os
+
+from database import get_manager
+from storage import MAX_GAP_SECONDS, STATUS_CODES, get_storage, table_exists, to_epoch
+
+logger = logging.getLogger(__name__)
+
+HOUR = 3600
+DAY = 86400
+
+# Rollup table name and bucket width
+ROLLUP_TABLES = {
+    'hourly': ('rollup_hourly', HOUR),
+    'daily': ('rollup_daily', DAY)
+}
+
+def split_seconds(start_ts, end_ts, width):
+    """Split [start_ts, end_ts) at bucket boundaries, yields (bucket_ts, seconds)"""
+    ts = start_ts
+    while ts < end_ts:
+        bucket = ts - ts % width
+        stop = min(bucket + width, end_ts)
+        yield bucket, stop - ts
+        ts = stop
+
+class RollupWriter:
+    """Maintains the rollup tables from a stream of observations"""
+
+    def __init__(self, max_gap=MAX_GAP_SECONDS):
+        self.max_gap = max_gap
+
+    def init_schema(self, conn):
+        for table, _ in ROLLUP_TABLES.values():
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table} (
+                    station_id INTEGER NOT NULL,
+                    bucket_ts INTEGER NOT NULL,
+                    status INTEGER NOT NULL,
+                    samples INTEGER NOT NULL DEFAULT 0,
+                    seconds INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (station_id, bucket_ts, status)
+                ) WITHOUT ROWID
+            ''')
+
+        # Last observation per station, the start of the next span to attribute
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS rollup_state (
+                station_id INTEGER PRIMARY KEY,
+                last_ts INTEGER NOT NULL,
+                last_status INTEGER NOT NULL
+            )
+        ''')
+
+    def _deltas(self, samples, state):
+        """Fold (station_id, ts, code) samples into {(table, station, bucket, code): [samples, seconds]}
+
+        state maps station_id to its (last_ts, last_code) and is updated in place.
+        Seconds since the previous observation go to the previous status, unless
+        the gap is long enough to mean the scraper was not running.
+        """
+        deltas = {}
+
+        def add(table, station_id, bucket, code, samples=0, seconds=0):
+            entry = deltas.setdefault((table, station_id, bucket, code), [0, 0])
+            entry[0] += samples
+            entry[1] += seconds
+
+        for station_id, ts, code in samples:
+            last = state.get(station_id)
+            if last is not None and ts <= last[0]:
+                continue
+            for table, width in ROLLUP_TABLES.values():
+                add(table, station_id, ts - ts % width, code, samples=1)
+                if last is not None and ts - last[0] <= self.max_gap:
+                    for bucket, seconds in split_seconds(last[0], ts, width):
+                        add(table, station_id, bucket, last[1], seconds=seconds)
+            state[station_id] = (ts, code)
+        return deltas
+
+    def _write(self, conn, deltas, state):
+        for table, _ in ROLLUP_TABLES.values():
+            conn.executemany(f'''
+                INSERT INTO {table} (station_id, bucket_ts, status, samples, seconds)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (station_id, bucket_ts, status) DO UPDATE SET
+                    samples = samples + excluded.samples,
+                    seconds = seconds + excluded.seconds
+            ''', [
+                (station_id, bucket, code, samples, seconds)
+                for (name, station_id, bucket, code), (samples, seconds) in deltas.items()
+                if name == table
+            ])
+        conn.executemany('''
+            INSERT OR REPLACE INTO rollup_state (station_id, last_ts, last_status)
+            VALUES (?, ?, ?)
+        ''', [(station_id, ts, code) for station_id, (ts, code) in state.items()])
+
+    def apply(self, conn, rows):
+        """Fold (location_id, timestamp, status) rows into the rollups"""
+        samples = sorted((loc, to_epoch(ts), STATUS_CODES[status]) for loc, ts, status in rows)
+        state = {}
+        for station_id in {sample[0] for sample in samples}:
+            row = conn.execute(
+                'SELECT last_ts, last_status FROM rollup_state WHERE station_id = ?', (station_id,)
+            ).fetchone()
+            if row is not None:
+                state[station_id] = tuple(row)
+        self._write(conn, self._deltas(samples, state), state)
+
+    def rebuild(self, conn, storage):
+        """Recompute every rollup from the stored history"""
+        self.init_schema(conn)
+        for table, _ in ROLLUP_TABLES.values():
+            conn.execute(f'DELETE FROM {table}')
+        conn.execute('DELETE FROM rollup_state')
+
+        for station_id in storage.stations(conn):
+            # History comes newest first; the fold needs it oldest first
+            rows = [
+                (station_id, to_epoch(row['timestamp']), STATUS_CODES[row['status']])
+                for row in storage.iter_history(conn, station_id, expand=True)
+            ]
+            rows.reverse()
+            state = {}
+            self._write(conn, self._deltas(rows, state), state)
+            logger.info(f"Rebuilt rollups for station {station_id} from {len(rows)} samples")
+
+def has_rollups(conn):
+    """Whether the database maintains rollup tables"""
+    return table_exists(conn, 'rollup_state')
+
+class RolledUpStorage:
+    """Storage wrapper that updates the rollups in the same transaction as each write"""
+
+    def __init__(self, storage, rollups=None):
+        self.storage = storage
+        self.rollups = rollups or RollupWriter()
+
+    def __getattr__(self, name):
+        return getattr(self.storage, name)
+
+    def init_schema(self, conn):
+        self.storage.init_schema(conn)
+        self.rollups.init_schema(conn)
+
+    def write(self, conn, rows):
+        self.storage.write(conn, rows)
+        self.rollups.apply(conn, rows)
+
+def main():
+    """Main function for command-line usage"""
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description='Build the hourly/daily rollup tables from stored history')
+    parser.add_argument('--db', type=str, default='charger_data.db', help='Database file path')
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        logger.error(f"Database not found: {args.db}")
+        return 1
+
+    db = get_manager(args.db)
+    with db.transaction() as conn:
+        storage = get_storage('auto', conn)
+        RollupWriter().rebuild(conn, storage)
+    logger.info("Rollups rebuilt; new observations will keep them up to date")
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -1,16 +1,27 @@
 #!/usr/bin/env python3
 """
 Background scheduler for automated charger status polling
-Runs the scraper every 5 minutes
+Polls each station on its own drift-free schedule, every 5 minutes or adaptively
 """
 
-import schedule
+import asyncio
+import random
 import time
+import argparse
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from charger_scraper import ChargerScraper
+from database import close_all
+from forecast import AvailabilityForecaster, slot_of
+from lazy_import import lazy_module
+import metrics
+from storage import MAX_GAP_SECONDS
 import signal
 import sys
 
+np = lazy_module('numpy')
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -22,61 +33,247 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# How often buffered observations are checked against the flush interval
+FLUSH_CHECK_SECONDS = 5
+
+SCHEDULER_LAG = metrics.histogram('charger_scheduler_lag_seconds', 'Delay of each poll past its planned time')
+SCHEDULER_POLLS = metrics.counter('charger_scheduler_polls_total', 'Scheduled polls by result', ['result'])
+
+class PollingPolicy:
+    """Per-station polling intervals: fixed, or adapted to recent transitions and historical activity
+
+    Adaptive polling frequency follows the square root of how often a slot of
+    the week has historically changed relative to the station's average: a
+    slot that changes four times as often is polled twice as often. Busy slots
+    are polled faster than the base interval and quiet ones slower, with fewer
+    polls overall than a fixed interval. Right after a transition the station
+    is polled at min_interval for burst_window seconds.
+
+    Intervals are capped so that jitter and a slow fetch never stretch the gap
+    between two observations past MAX_GAP_SECONDS, beyond which the stored
+    history counts the time as unknown.
+    """
+
+    # Hours of average activity blended into each slot, so sparse slots stay near the base interval
+    PRIOR_HOURS = 2.0
+
+    def __init__(self, interval=300, min_interval=60, max_interval=720, burst_window=900,
+                 jitter=0.1, forecaster=None, refresh_interval=3600, fetch_deadline=20.0):
+        ceiling = self.longest_interval(jitter, fetch_deadline)
+        if max(interval, max_interval) > ceiling:
+            logger.warning(f"Polling intervals capped at {ceiling:.0f}s to keep observations "
+                           f"less than {MAX_GAP_SECONDS}s apart")
+        self.interval = min(interval, ceiling)
+        self.max_interval = min(max_interval, ceiling)
+        self.min_interval = min(min_interval, self.max_interval)
+        self.burst_window = burst_window
+        self.jitter = jitter
+        self.forecaster = forecaster
+        self.refresh_interval = refresh_interval
+        self._last_status = {}
+        self._burst_until = {}
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def longest_interval(jitter, fetch_deadline, max_gap=MAX_GAP_SECONDS):
+        """Longest interval whose poll gaps stay under max_gap
+
+        Two consecutive jitter offsets can stretch a gap to interval * (1 + 2 * jitter),
+        and a fetch that runs to its deadline adds fetch_deadline more.
+        """
+        return (max_gap - fetch_deadline) / (1 + 2 * jitter)
+
+    @property
+    def adaptive(self):
+        return self.forecaster is not None
+
+    def record(self, location_id, status, now):
+        """Note a polled status at monotonic time now, returns True if it changed"""
+        with self._lock:
+            previous = self._last_status.get(location_id)
+            self._last_status[location_id] = status
+            changed = previous is not None and status != previous
+            if changed and self.adaptive:
+                self._burst_until[location_id] = now + self.burst_window
+            return changed
+
+    def _slot_intervals(self, location_id):
+        """Interval for each slot of the week from the station's observed change rates"""
+        changes, hours = self.forecaster.activity(location_id)
+        if changes.sum() == 0:
+            return np.full(len(changes), float(self.interval))
+
+        mean_rate = changes.sum() / hours.sum()
+        rate = (changes + mean_rate * self.PRIOR_HOURS) / (hours + self.PRIOR_HOURS)
+        return np.clip(self.interval * np.sqrt(mean_rate / rate), self.min_interval, self.max_interval)
+
+    def next_interval(self, location_id, now, wall_time=None):
+        """Seconds until the station's next poll, without jitter"""
+        if not self.adaptive:
+            return self.interval
+
+        with self._lock:
+            if now < self._burst_until.get(location_id, 0):
+                return self.min_interval
+            table = self._tables.get(location_id)
+
+        if table is None or now - table[0] >= self.refresh_interval:
+            try:
+                table = (now, self._slot_intervals(location_id))
+            except Exception as e:
+                logger.error(f"Error computing polling intervals for station {location_id}: {e}")
+                table = (now, None)
+            with self._lock:
+                self._tables[location_id] = table
+
+        if table[1] is None:
+            return self.interval
+        return float(table[1][int(slot_of(wall_time if wall_time is not None else time.time()))])
+
+    def jittered(self, interval):
+        """Random offset of up to +/- jitter * interval, so stations do not poll in lockstep"""
+        return random.uniform(-self.jitter, self.jitter) * interval
+
 class ChargerScheduler:
-    def __init__(self):
-        self.scraper = ChargerScraper()
+    def __init__(self, stations=None, buffer_size=None, flush_interval=60.0, policy=None, max_workers=4):
+        self.scraper = ChargerScraper(buffer_size=buffer_size, flush_interval=flush_interval)
+        self.stations = stations
+        self.policy = policy or PollingPolicy()
+        self.max_workers = max_workers
         self.running = True
-        
+        self.polls = 0
+        self._loop = None
+        self._stop = None
+
         # Set up signal handlers for graceful shutdown
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
-    
+
     def signal_handler(self, signum, frame):
         """Handle shutdown signals gracefully"""
         logger.info(f"Received signal {signum}, shutting down...")
         self.running = False
-    
-    def run_status_check(self):
-        """Run a single status check"""
+        # Only wake the event loop: the handler runs on the main thread, which may be inside
+        # a flush holding the writer's lock. start_scheduler() flushes once the loop stops.
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+    def run_status_check(self, location_id=None):
+        """Run a single status check, returns the status or None on failure"""
         try:
-            logger.info("Running scheduled status check...")
-            success, status = self.scraper.run_single_check()
-            
+            success, status = self.scraper.run_single_check(location_id)
             if success:
-                logger.info(f"Scheduled check completed: {status}")
-            else:
-                logger.error("Scheduled check failed")
-                
+                logger.info(f"Scheduled check completed: {location_id or self.scraper.location_id}: {status}")
+                return status
+            logger.error("Scheduled check failed")
         except Exception as e:
             logger.error(f"Error in scheduled check: {e}")
-    
+        return None
+
+    async def _sleep_until(self, deadline):
+        """Wait for a monotonic deadline, returns True if the scheduler was stopped first"""
+        try:
+            await asyncio.wait_for(self._stop.wait(), max(deadline - self._loop.time(), 0))
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _poll_station(self, location_id, executor):
+        """Poll one station on its own schedule until stopped"""
+        loop = self._loop
+        # Deadlines advance from the previous deadline, not from when a scrape finished, so they never drift
+        deadline = loop.time()
+        offset = 0.0
+        while not self._stop.is_set():
+            if await self._sleep_until(deadline + offset):
+                break
+            SCHEDULER_LAG.observe(max(loop.time() - deadline - offset, 0))
+
+            status = await loop.run_in_executor(executor, self.run_status_check, location_id)
+            self.polls += 1
+            SCHEDULER_POLLS.labels('ok' if status is not None else 'failed').inc()
+            now = loop.time()
+            if status is not None and self.policy.record(location_id, status, now):
+                logger.info(f"Station {location_id} changed to {status}")
+
+            # The interval may build a forecast model on first use; keep that off the event loop
+            interval = await loop.run_in_executor(executor, self.policy.next_interval, location_id, now)
+            deadline += interval
+            if deadline <= now:
+                # A scrape overran its interval; skip the missed polls rather than bunching them up
+                missed = int((now - deadline) // interval) + 1
+                deadline += missed * interval
+                logger.warning(f"Station {location_id} fell {missed} poll(s) behind")
+            offset = self.policy.jittered(interval)
+            logger.debug(f"Station {location_id} next poll in {deadline + offset - now:.0f}s")
+
+    async def _flush_buffered(self):
+        """Commit buffered observations once they are due"""
+        while not await self._sleep_until(self._loop.time() + FLUSH_CHECK_SECONDS):
+            self.scraper.flush(only_if_due=True)
+
+    async def run(self):
+        """Poll every station until stopped"""
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        if not self.running:
+            return
+
+        stations = self.stations or [self.scraper.location_id]
+        # Bounds concurrent scrapes; a slow station only delays its own next poll
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='poll') as executor:
+            await asyncio.gather(
+                self._flush_buffered(),
+                *(self._poll_station(location_id, executor) for location_id in stations)
+            )
+
     def start_scheduler(self):
         """Start the background scheduler"""
-        logger.info("Starting charger status scheduler...")
-        
-        # Schedule the status check every 5 minutes
-        schedule.every(5).minutes.do(self.run_status_check)
-        
-        # Run an initial check
-        self.run_status_check()
-        
-        # Main scheduler loop
-        while self.running:
-            try:
-                schedule.run_pending()
-                time.sleep(30)  # Check every 30 seconds for pending jobs
-            except KeyboardInterrupt:
-                logger.info("Received keyboard interrupt, shutting down...")
-                break
-            except Exception as e:
-                logger.error(f"Error in scheduler loop: {e}")
-                time.sleep(60)  # Wait a minute before retrying
-        
-        logger.info("Scheduler stopped")
+        mode = 'adaptive' if self.policy.adaptive else f"every {self.policy.interval:.0f}s"
+        logger.info(f"Starting charger status scheduler ({mode})...")
+
+        try:
+            asyncio.run(self.run())
+        except KeyboardInterrupt:
+            logger.info("Received keyboard interrupt, shutting down...")
+
+        # Flush buffered writes, then checkpoint the WAL and release database connections
+        self.scraper.close()
+        close_all()
+        logger.info(f"Scheduler stopped after {self.polls} polls")
 
 def main():
     """Main function"""
-    scheduler = ChargerScheduler()
+    parser = argparse.ArgumentParser(description='Poll charger status every 5 minutes, or adaptively')
+    parser.add_argument('--stations', type=int, nargs='+', help='ChargeHub location IDs to poll')
+    parser.add_argument('--buffer-size', type=int, help='Buffer observations and commit them in groups of this size')
+    parser.add_argument('--flush-interval', type=float, default=60.0,
+                        help='Maximum seconds an observation stays buffered (default: 60)')
+    parser.add_argument('--interval', type=float, default=300, help='Seconds between polls (default: 300)')
+    parser.add_argument('--jitter', type=float, default=0.1,
+                        help='Random spread of each poll as a fraction of the interval (default: 0.1)')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Poll faster after transitions and in busy hours, slower in quiet ones')
+    parser.add_argument('--min-interval', type=float, default=60, help='Fastest adaptive interval (default: 60)')
+    parser.add_argument('--max-interval', type=float, default=720, help='Slowest adaptive interval (default: 720)')
+    parser.add_argument('--history-days', type=int, default=180,
+                        help='Days of history that define busy and quiet hours (default: 180)')
+    parser.add_argument('--metrics-port', type=int, help='Serve Prometheus metrics on this port at /metrics')
+
+    args = parser.parse_args()
+
+    forecaster = None
+    if args.adaptive:
+        forecaster = AvailabilityForecaster('charger_data.db', history_days=args.history_days)
+    policy = PollingPolicy(args.interval, args.min_interval, args.max_interval,
+                           jitter=args.jitter, forecaster=forecaster)
+    scheduler = ChargerScheduler(args.stations, args.buffer_size, args.flush_interval, policy)
+    if forecaster is not None:
+        # Keep the slot models current with what this scheduler stores
+        scheduler.scraper.add_listener(forecaster.on_store)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
     scheduler.start_scheduler()
 
 if __name__ == "__main__":
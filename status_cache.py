@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+In-process cache of the latest status per station for the API server
+Updated directly by the scraper's write path and invalidated when another
+process changes the database file
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+def make_etag(data):
+    """Stable entity tag for a JSON-serializable payload"""
+    payload = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+class LatestStatusCache:
+    """Latest status per station, served from memory until the database changes"""
+
+    def __init__(self, scraper):
+        self.scraper = scraper
+        self._entries = {}
+        self._lock = threading.Lock()
+        # Signature of the database just before this thread's store
+        self._local = threading.local()
+        self._signature = self._db_signature()
+        scraper.add_pre_store_hook(self.before_store)
+        scraper.add_listener(self.on_store)
+
+    def _db_signature(self):
+        """Modification time and size of the database and its WAL; a stat, not a query"""
+        signature = []
+        for path in (self.scraper.db_path, self.scraper.db_path + '-wal'):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _check_external_writes(self):
+        """Drop every entry if the database file changed since the last check"""
+        signature = self._db_signature()
+        if signature != self._signature:
+            with self._lock:
+                self._signature = signature
+                self._entries.clear()
+
+    def before_store(self):
+        """Scraper pre-store hook: note the database's signature before the write"""
+        self._local.before = self._db_signature()
+
+    def on_store(self, rows):
+        """Scraper listener: keep the newest stored status per station"""
+        before, self._local.before = getattr(self._local, 'before', None), None
+        signature = self._db_signature()
+        with self._lock:
+            if before != self._signature:
+                # Another process wrote since the last check; its rows may be newer than the entries
+                self._entries.clear()
+            # Adopting the new signature keeps this process's own write from invalidating the entries
+            self._signature = signature
+            for location_id, timestamp, status in rows:
+                current = self._entries.get(location_id)
+                if current is None or timestamp >= current['data']['timestamp']:
+                    data = {'timestamp': timestamp, 'status': status}
+                    self._entries[location_id] = {'data': data, 'etag': make_etag(data)}
+
+    def get(self, location_id=None):
+        """Cached {'data', 'etag'} entry for a station, loading it on a miss; None if no data"""
+        location_id = location_id or self.scraper.location_id
+        self._check_external_writes()
+
+        with self._lock:
+            entry = self._entries.get(location_id)
+        if entry is not None:
+            metrics.CACHE_REQUESTS.labels('status', 'hit').inc()
+            return entry
+
+        metrics.CACHE_REQUESTS.labels('status', 'miss').inc()
+        data = self.scraper.get_latest_status(location_id)
+        if data is None:
+            return None
+        entry = {'data': data, 'etag': make_etag(data)}
+        with self._lock:
+            self._entries.setdefault(location_id, entry)
+        return entry
+
+    def invalidate(self, location_id=None):
+        """Drop one station's entry, or all of them"""
+        with self._lock:
+            if location_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(location_id, None)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Status extractors for ChargeHub pages
+Turns a fetched page into one of the charger status values
+"""
+
+import logging
+
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:  # lxml is optional, the selector cascade always works
+    etree = None
+    lxml_html = None
+
+from lazy_import import lazy_module
+
+logger = logging.getLogger(__name__)
+
+# The cascade is the fallback behind the lxml fast path; import it when first needed
+bs4 = lazy_module('bs4')
+
+# Selectors tried in order; the first element whose text classifies wins
+STATUS_SELECTORS = [
+    'div.availability',
+    'div[class*="availability"]',
+    'span[class*="available"]',
+    'div[class*="status"]',
+    '.charger-status',
+    '.dc-fast-charger'
+]
+
+def classify_element_text(text):
+    """Classify the text of a single status element, or None if it says nothing"""
+    text = text.strip().lower()
+    if 'available' in text and '1/1' in text:
+        return 'Available'
+    elif 'available' in text and '0/1' in text:
+        return 'In Use'
+    elif 'out of order' in text or 'maintenance' in text:
+        return 'Out of Order'
+    return None
+
+def classify_page_text(page_text):
+    """Classify the whole page text when no status element matched"""
+    page_text = page_text.lower()
+    if '1/1 available' in page_text or 'available' in page_text:
+        # Try to determine if it's actually available or in use
+        if '0/1' in page_text:
+            return 'In Use'
+        return 'Available'
+    elif 'out of order' in page_text or 'maintenance' in page_text:
+        return 'Out of Order'
+    return 'Unknown'
+
+class SelectorCascadeExtractor:
+    """Reference extractor: BeautifulSoup tree plus the CSS selector cascade"""
+    name = 'cascade'
+
+    def extract(self, html):
+        soup = bs4.BeautifulSoup(html, 'html.parser')
+
+        for selector in STATUS_SELECTORS:
+            for element in soup.select(selector):
+                status = classify_element_text(element.get_text())
+                if status:
+                    return status
+
+        # Fallback: look for any text containing availability info
+        return classify_page_text(soup.get_text())
+
+class LxmlXPathExtractor:
+    """Fast extractor: lxml's C parser with the cascade precompiled to XPath"""
+    name = 'lxml'
+
+    def __init__(self):
+        if etree is None:
+            raise ImportError("lxml is not installed")
+
+        def has_class(cls):
+            return f"contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')"
+
+        # Same order and matching rules as STATUS_SELECTORS
+        self.selectors = [
+            etree.XPath(f"//div[{has_class('availability')}]"),
+            etree.XPath("//div[contains(@class, 'availability')]"),
+            etree.XPath("//span[contains(@class, 'available')]"),
+            etree.XPath("//div[contains(@class, 'status')]"),
+            etree.XPath(f"//*[{has_class('charger-status')}]"),
+            etree.XPath(f"//*[{has_class('dc-fast-charger')}]")
+        ]
+        # BeautifulSoup's get_text() skips script/style/template contents, so do the same here
+        self.element_text = etree.XPath(
+            "descendant-or-self::text()[not(ancestor::script or ancestor::style or ancestor::template)]"
+        )
+
+    def _text(self, node):
+        return ''.join(self.element_text(node))
+
+    def extract(self, html):
+        """Return the status, or None if the page could not be parsed"""
+        try:
+            root = lxml_html.fromstring(html)
+        except (etree.ParserError, ValueError) as e:
+            logger.debug(f"lxml could not parse page: {e}")
+            return None
+
+        for selector in self.selectors:
+            for element in selector(root):
+                status = classify_element_text(self._text(element))
+                if status:
+                    return status
+
+        return classify_page_text(self._text(root))
+
+class FastPathExtractor:
+    """Try the fast extractor first and fall back to the selector cascade"""
+    name = 'auto'
+
+    def __init__(self, fast, fallback):
+        self.fast = fast
+        self.fallback = fallback
+
+    def extract(self, html):
+        try:
+            status = self.fast.extract(html)
+        except Exception as e:
+            logger.warning(f"Fast extractor failed, using fallback: {e}")
+            status = None
+        if status is None:
+            return self.fallback.extract(html)
+        return status
+
+def get_extractor(name='auto'):
+    """Build an extractor by name: 'auto', 'lxml' or 'cascade'"""
+    if name == 'cascade':
+        return SelectorCascadeExtractor()
+    if name == 'lxml':
+        return LxmlXPathExtractor()
+    if name == 'auto':
+        if etree is None:
+            return SelectorCascadeExtractor()
+        return FastPathExtractor(LxmlXPathExtractor(), SelectorCascadeExtractor())
+    raise ValueError(f"Unknown extractor: {name}")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Status change broadcaster for streaming API clients
+Turns stored observations into change events that SSE and long-poll
+clients wait on, without querying the database per client
+"""
+
+from collections import deque
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class StatusBroadcaster:
+    """Sequence-numbered ring buffer of status changes with blocking waits"""
+
+    def __init__(self, history_size=256):
+        self._events = deque(maxlen=history_size)
+        self._last_status = {}
+        # Sequence numbers start at the process start time in milliseconds, so
+        # they keep growing across restarts and a client's old cursor is never
+        # mistaken for one of this process
+        self._seq = int(time.time() * 1000)
+        self._cond = threading.Condition()
+        self._watched = set()
+        self._watcher = None
+        self._watcher_stop = threading.Event()
+        self._watcher_lock = threading.Lock()
+
+    @property
+    def cursor(self):
+        """Sequence number of the newest event"""
+        with self._cond:
+            return self._seq
+
+    def is_valid(self, since):
+        """Whether events_since(since) is complete: the cursor is from this process and not yet evicted"""
+        with self._cond:
+            oldest = self._events[0]['id'] - 1 if self._events else self._seq
+            return oldest <= since <= self._seq
+
+    def publish(self, rows):
+        """Scraper listener: emit an event for each station whose status changed"""
+        with self._cond:
+            changed = False
+            for location_id, timestamp, status in rows:
+                previous = self._last_status.get(location_id)
+                if previous is not None and previous['status'] == status:
+                    continue
+                if previous is not None and timestamp < previous['timestamp']:
+                    continue
+                self._last_status[location_id] = {'timestamp': timestamp, 'status': status}
+                self._seq += 1
+                self._events.append({
+                    'id': self._seq,
+                    'station': location_id,
+                    'timestamp': timestamp,
+                    'status': status,
+                    'previous': previous['status'] if previous else None
+                })
+                changed = True
+            if changed:
+                self._cond.notify_all()
+
+    def prime(self, location_id, data):
+        """Record a station's current status without emitting an event"""
+        with self._cond:
+            self._watched.add(location_id)
+            if data and location_id not in self._last_status:
+                self._last_status[location_id] = dict(data)
+
+    def events_since(self, since, location_id=None):
+        """Buffered events newer than the cursor, optionally for one station"""
+        with self._cond:
+            return [
+                event for event in self._events
+                if event['id'] > since and (location_id is None or event['station'] == location_id)
+            ]
+
+    def wait(self, since, timeout, location_id=None):
+        """Block until events newer than the cursor exist or the timeout passes"""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: any(
+                    event['id'] > since and (location_id is None or event['station'] == location_id)
+                    for event in reversed(self._events)
+                ),
+                timeout
+            )
+        return self.events_since(since, location_id)
+
+    def start_watcher(self, status_cache, interval=2.0):
+        """Publish changes written by other processes (e.g. the scheduler)
+
+        One shared thread re-reads watched stations through the status cache,
+        which only touches the database after the file changed.
+        """
+        with self._watcher_lock:
+            if self._watcher is not None:
+                return
+            self._watcher_stop = threading.Event()
+            self._watcher = threading.Thread(
+                target=self._watch, args=(status_cache, interval, self._watcher_stop),
+                name='status-watcher', daemon=True
+            )
+            self._watcher.start()
+
+    def _watch(self, status_cache, interval, stop):
+        while not stop.wait(interval):
+            with self._cond:
+                stations = list(self._watched)
+            for location_id in stations:
+                try:
+                    entry = status_cache.get(location_id)
+                except Exception as e:
+                    logger.error(f"Status watcher failed for station {location_id}: {e}")
+                    continue
+                if entry:
+                    data = entry['data']
+                    self.publish([(location_id, data['timestamp'], data['status'])])
+
+    def stop_watcher(self):
+        """Stop the cross-process watcher thread"""
+        with self._watcher_lock:
+            if self._watcher is not None:
+                self._watcher_stop.set()
+                self._watcher = None
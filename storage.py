@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""
+Storage formats for charger status samples
+The legacy format keeps ISO-8601 TEXT rows; the compact format keeps integer
+epoch seconds and status codes in a clustered (station, ts) table; the
+intervals format keeps one row per run of identical statuses
+"""
+
+from datetime import datetime, timezone
+from itertools import islice
+import logging
+import sqlite3
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCATION_ID = 62901
+
+STATUS_CODES = {
+    'Unknown': 0,
+    'Available': 1,
+    'In Use': 2,
+    'Out of Order': 3
+}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+# Samples further apart than this start a new interval even if the status is unchanged
+MAX_GAP_SECONDS = 900
+
+DB_WRITE_SECONDS = metrics.histogram('charger_db_write_seconds', 'Time to commit a batch of observations')
+DROPPED_OBSERVATIONS = metrics.counter('charger_dropped_observations_total',
+                                       'Buffered observations dropped instead of stored, by reason', ['reason'])
+
+def to_epoch(timestamp):
+    """Convert an ISO-8601 timestamp to integer epoch seconds (naive means UTC)"""
+    dt = datetime.fromisoformat(timestamp)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+def from_epoch(ts):
+    """Convert epoch seconds to an ISO-8601 UTC timestamp"""
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+def expand_interval(start_ts, end_ts, samples):
+    """Spread an interval's sample count evenly between its start and end"""
+    if samples <= 1 or end_ts == start_ts:
+        return [start_ts] * max(samples, 1)
+    step = (end_ts - start_ts) / (samples - 1)
+    return [int(round(start_ts + i * step)) for i in range(samples)]
+
+def compress_samples(samples, max_gap=MAX_GAP_SECONDS):
+    """Fold (station_id, ts, code) samples sorted by station and ts into intervals
+
+    Yields [station_id, start_ts, end_ts, code, samples] lists.
+    """
+    current = None
+    for station_id, ts, code in samples:
+        if (current is not None and current[0] == station_id and current[3] == code
+                and ts - current[2] <= max_gap):
+            current[2] = ts
+            current[4] += 1
+            continue
+        if current is not None:
+            yield current
+        current = [station_id, ts, ts, code, 1]
+    if current is not None:
+        yield current
+
+def normalize_timestamp(timestamp):
+    """Parse an ISO-8601 timestamp (naive means UTC) into the stored UTC format"""
+    dt = datetime.fromisoformat(timestamp)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).isoformat()
+
+def _iter_rows(cursor, batch_size):
+    """Yield rows off a cursor in fetchmany batches, closing it when done"""
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+def _take(rows, limit):
+    """First limit items of a generator, closing it (and its cursor) afterwards"""
+    try:
+        return list(islice(rows, limit))
+    finally:
+        rows.close()
+
+def _where(sql, params, clauses):
+    """Append (clause, value) filters whose value is set"""
+    for clause, value in clauses:
+        if value is not None:
+            sql += f' AND {clause}'
+            params.append(value)
+    return sql, params
+
+def init_status_codes(conn):
+    """Create and fill the status code lookup table"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS status_codes (
+            code INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    conn.executemany(
+        'INSERT OR IGNORE INTO status_codes (code, name) VALUES (?, ?)',
+        sorted(STATUS_NAMES.items())
+    )
+
+def table_exists(conn, name):
+    """Check whether a table exists in the database"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone()
+    return row is not None
+
+class LegacyStorage:
+    """ISO TEXT rows: the primary station in utilization, others in station_utilization"""
+    name = 'legacy'
+
+    def __init__(self, primary_location_id=DEFAULT_LOCATION_ID):
+        self.primary_location_id = primary_location_id
+
+    def init_schema(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS utilization (
+                timestamp TEXT PRIMARY KEY,
+                status TEXT CHECK(status IN ('Available', 'In Use', 'Out of Order', 'Unknown'))
+            )
+        ''')
+
+        # Samples for every other station written by multi-station sweeps
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS station_utilization (
+                location_id INTEGER NOT NULL,
+                timestamp TEXT NOT NULL,
+                status TEXT CHECK(status IN ('Available', 'In Use', 'Out of Order', 'Unknown')),
+                PRIMARY KEY (location_id, timestamp)
+            )
+        ''')
+
+    def write(self, conn, rows):
+        """Write (location_id, timestamp, status) rows"""
+        primary = [(ts, status) for loc, ts, status in rows if loc == self.primary_location_id]
+        others = [(loc, ts, status) for loc, ts, status in rows if loc != self.primary_location_id]
+        if primary:
+            conn.executemany('''
+                INSERT OR REPLACE INTO utilization (timestamp, status)
+                VALUES (?, ?)
+            ''', primary)
+        if others:
+            conn.executemany('''
+                INSERT OR REPLACE INTO station_utilization (location_id, timestamp, status)
+                VALUES (?, ?, ?)
+            ''', others)
+
+    def iter_history(self, conn, location_id, start=None, end=None, before=None,
+                     expand=False, batch_size=500):
+        """Samples for a station newest first, within [start, end) and older than before
+
+        Bounds are ISO-8601 timestamps in the stored UTC format.
+        """
+        if location_id == self.primary_location_id:
+            sql, params = 'SELECT timestamp, status FROM utilization WHERE 1 = 1', []
+        else:
+            sql, params = 'SELECT timestamp, status FROM station_utilization WHERE location_id = ?', [location_id]
+        sql, params = _where(sql, params, [
+            ('timestamp >= ?', start),
+            ('timestamp < ?', end),
+            ('timestamp < ?', before)
+        ])
+        cursor = conn.execute(sql + ' ORDER BY timestamp DESC', params)
+        for timestamp, status in _iter_rows(cursor, batch_size):
+            yield {'timestamp': timestamp, 'status': status}
+
+    def history(self, conn, location_id, limit, expand=False):
+        """Most recent samples for a station, newest first"""
+        return _take(self.iter_history(conn, location_id, batch_size=min(limit, 500)), limit)
+
+    def latest(self, conn, location_id):
+        """Most recent sample for a station, or None"""
+        rows = self.history(conn, location_id, 1)
+        return rows[0] if rows else None
+
+    def stations(self, conn):
+        """Location IDs that have stored samples"""
+        stations = [row[0] for row in conn.execute(
+            'SELECT DISTINCT location_id FROM station_utilization ORDER BY location_id'
+        )]
+        if conn.execute('SELECT 1 FROM utilization LIMIT 1').fetchone():
+            stations = sorted(set(stations) | {self.primary_location_id})
+        return stations
+
+class CompactStorage:
+    """Integer epoch seconds and status codes, clustered on (station_id, ts)"""
+    name = 'compact'
+
+    def init_schema(self, conn):
+        init_status_codes(conn)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS samples (
+                station_id INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                status INTEGER NOT NULL REFERENCES status_codes(code),
+                PRIMARY KEY (station_id, ts)
+            ) WITHOUT ROWID
+        ''')
+
+    def write(self, conn, rows):
+        """Write (location_id, timestamp, status) rows"""
+        conn.executemany('''
+            INSERT OR REPLACE INTO samples (station_id, ts, status)
+            VALUES (?, ?, ?)
+        ''', [(loc, to_epoch(ts), STATUS_CODES[status]) for loc, ts, status in rows])
+
+    def iter_history(self, conn, location_id, start=None, end=None, before=None,
+                     expand=False, batch_size=500):
+        """Samples for a station newest first, within [start, end) and older than before"""
+        sql, params = _where('SELECT ts, status FROM samples WHERE station_id = ?', [location_id], [
+            ('ts >= ?', to_epoch(start) if start else None),
+            ('ts < ?', to_epoch(end) if end else None),
+            ('ts < ?', to_epoch(before) if before else None)
+        ])
+        cursor = conn.execute(sql + ' ORDER BY ts DESC', params)
+        for ts, code in _iter_rows(cursor, batch_size):
+            yield {'timestamp': from_epoch(ts), 'status': STATUS_NAMES[code]}
+
+    def history(self, conn, location_id, limit, expand=False):
+        """Most recent samples for a station, newest first"""
+        return _take(self.iter_history(conn, location_id, batch_size=min(limit, 500)), limit)
+
+    def latest(self, conn, location_id):
+        """Most recent sample for a station, or None"""
+        rows = self.history(conn, location_id, 1)
+        return rows[0] if rows else None
+
+    def stations(self, conn):
+        """Location IDs that have stored samples"""
+        return [row[0] for row in conn.execute('SELECT DISTINCT station_id FROM samples ORDER BY station_id')]
+
+class IntervalStorage:
+    """Change-point format: one row per run of identical statuses per station"""
+    name = 'intervals'
+
+    def __init__(self, max_gap=MAX_GAP_SECONDS):
+        self.max_gap = max_gap
+
+    def init_schema(self, conn):
+        init_status_codes(conn)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS status_intervals (
+                station_id INTEGER NOT NULL,
+                start_ts INTEGER NOT NULL,
+                end_ts INTEGER NOT NULL,
+                status INTEGER NOT NULL REFERENCES status_codes(code),
+                samples INTEGER NOT NULL DEFAULT 1,
+                PRIMARY KEY (station_id, start_ts)
+            ) WITHOUT ROWID
+        ''')
+
+    def write(self, conn, rows):
+        """Extend each station's open interval, or open a new one on a status change or gap"""
+        samples = sorted((loc, to_epoch(ts), STATUS_CODES[status]) for loc, ts, status in rows)
+        for station_id, ts, code in samples:
+            last = conn.execute('''
+                SELECT start_ts, end_ts, status FROM status_intervals
+                WHERE station_id = ?
+                ORDER BY start_ts DESC LIMIT 1
+            ''', (station_id,)).fetchone()
+
+            if last is not None and ts <= last[1]:
+                # Same-second duplicates are absorbed; older samples cannot reopen closed runs
+                if ts < last[1]:
+                    logger.warning(f"Ignoring out-of-order sample for station {station_id} at {from_epoch(ts)}")
+                continue
+
+            if last is not None and last[2] == code and ts - last[1] <= self.max_gap:
+                conn.execute('''
+                    UPDATE status_intervals SET end_ts = ?, samples = samples + 1
+                    WHERE station_id = ? AND start_ts = ?
+                ''', (ts, station_id, last[0]))
+            else:
+                conn.execute('''
+                    INSERT INTO status_intervals (station_id, start_ts, end_ts, status, samples)
+                    VALUES (?, ?, ?, ?, 1)
+                ''', (station_id, ts, ts, code))
+
+    def iter_history(self, conn, location_id, start=None, end=None, before=None,
+                     expand=False, batch_size=500):
+        """Runs (or expanded samples) for a station newest first
+
+        Runs are keyed by their start time: before pages on it, and [start, end)
+        keeps runs that overlap the range. Expanded samples are clipped to it.
+        """
+        start_ts = to_epoch(start) if start else None
+        stops = [to_epoch(value) for value in (end, before) if value]
+        stop_ts = min(stops) if stops else None
+        sql, params = _where(
+            'SELECT start_ts, end_ts, status, samples FROM status_intervals WHERE station_id = ?',
+            [location_id],
+            [('end_ts >= ?', start_ts), ('start_ts < ?', stop_ts)]
+        )
+        cursor = conn.execute(sql + ' ORDER BY start_ts DESC', params)
+        for run_start, run_end, code, samples in _iter_rows(cursor, batch_size):
+            status = STATUS_NAMES[code]
+            if not expand:
+                yield {
+                    'timestamp': from_epoch(run_start),
+                    'end': from_epoch(run_end),
+                    'status': status,
+                    'samples': samples
+                }
+                continue
+            for ts in reversed(expand_interval(run_start, run_end, samples)):
+                if stop_ts is not None and ts >= stop_ts:
+                    continue
+                if start_ts is not None and ts < start_ts:
+                    break
+                yield {'timestamp': from_epoch(ts), 'status': status}
+
+    def history(self, conn, location_id, limit, expand=False):
+        """Most recent intervals for a station, or expanded samples, newest first"""
+        return _take(self.iter_history(conn, location_id, expand=expand, batch_size=min(limit, 500)), limit)
+
+    def latest(self, conn, location_id):
+        """Most recent observation for a station, or None"""
+        row = conn.execute('''
+            SELECT end_ts, status FROM status_intervals
+            WHERE station_id = ?
+            ORDER BY start_ts DESC LIMIT 1
+        ''', (location_id,)).fetchone()
+        if row is None:
+            return None
+        return {'timestamp': from_epoch(row[0]), 'status': STATUS_NAMES[row[1]]}
+
+    def stations(self, conn):
+        """Location IDs that have stored runs"""
+        return [row[0] for row in conn.execute(
+            'SELECT DISTINCT station_id FROM status_intervals ORDER BY station_id'
+        )]
+
+def detect_storage(conn):
+    """Name of the storage format present in a database ('legacy' until migrated)"""
+    if table_exists(conn, 'status_intervals'):
+        return 'intervals'
+    if table_exists(conn, 'samples'):
+        return 'compact'
+    return 'legacy'
+
+def get_storage(name, conn=None, primary_location_id=DEFAULT_LOCATION_ID):
+    """Build a storage format by name; 'auto' inspects the database"""
+    if name == 'auto':
+        name = detect_storage(conn) if conn is not None else 'legacy'
+    if name == 'legacy':
+        return LegacyStorage(primary_location_id)
+    if name == 'compact':
+        return CompactStorage()
+    if name == 'intervals':
+        return IntervalStorage()
+    raise ValueError(f"Unknown storage format: {name}")
+
+class BufferedWriter:
+    """Collects observations and writes them in one transaction (group commit)
+
+    While the database is busy or unavailable rows stay buffered, up to
+    max_buffered (default ten batches); the oldest are dropped beyond that.
+    """
+
+    def __init__(self, db, storage, max_rows=500, max_delay=60.0, max_buffered=None):
+        self.db = db
+        self.storage = storage
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.max_buffered = max_buffered or 10 * max_rows
+        self._rows = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._rows)
+
+    def extend(self, rows):
+        """Buffer (location_id, timestamp, status) rows, flushing when a threshold is hit"""
+        with self._lock:
+            if not self._rows:
+                self._oldest = time.monotonic()
+            self._rows.extend(rows)
+        self.flush_if_due()
+
+    def add(self, location_id, timestamp, status):
+        """Buffer a single observation"""
+        self.extend([(location_id, timestamp, status)])
+
+    def latest(self, location_id):
+        """Newest buffered observation for a station, or None"""
+        with self._lock:
+            for loc, timestamp, status in reversed(self._rows):
+                if loc == location_id:
+                    return {'timestamp': timestamp, 'status': status}
+        return None
+
+    def due(self):
+        """Whether the size or age threshold has been reached"""
+        with self._lock:
+            if not self._rows:
+                return False
+            return (len(self._rows) >= self.max_rows
+                    or time.monotonic() - self._oldest >= self.max_delay)
+
+    def flush_if_due(self):
+        """Flush if a threshold has been reached, returns the number of rows written"""
+        if self.due():
+            return self.flush()
+        return 0
+
+    def flush(self, block=True):
+        """Write every buffered row in one transaction, returns the number written
+
+        With block=False the call returns immediately if a flush is already
+        running in another thread. An OperationalError (locked database, full
+        disk) keeps the rows for the next flush and is raised; any other error
+        is blamed on individual rows, which are written one by one and dropped
+        if they fail.
+        """
+        if not self._flush_lock.acquire(blocking=block):
+            return 0
+        try:
+            with self._lock:
+                rows, self._rows = self._rows, []
+                self._oldest = None
+            if not rows:
+                return 0
+            try:
+                with DB_WRITE_SECONDS.time():
+                    with self.db.transaction() as conn:
+                        self.storage.write(conn, rows)
+            except sqlite3.OperationalError:
+                self._requeue(rows)
+                raise
+            except Exception as e:
+                logger.warning(f"Batch of {len(rows)} buffered observations failed ({e}); writing them one by one")
+                return self._write_each(rows)
+            logger.info(f"Flushed {len(rows)} buffered observations")
+            return len(rows)
+        finally:
+            self._flush_lock.release()
+
+    def _write_each(self, rows):
+        """Write rows in separate transactions, dropping those that fail, returns the number written"""
+        written = 0
+        for index, row in enumerate(rows):
+            try:
+                with self.db.transaction() as conn:
+                    self.storage.write(conn, [row])
+                written += 1
+            except sqlite3.OperationalError:
+                self._requeue(rows[index:])
+                raise
+            except Exception as e:
+                DROPPED_OBSERVATIONS.labels('invalid').inc()
+                logger.error(f"Dropped observation {row} that cannot be stored: {e}")
+        return written
+
+    def _requeue(self, rows):
+        """Put rows back in front of anything buffered meanwhile, dropping the oldest beyond max_buffered"""
+        with self._lock:
+            self._rows[:0] = rows
+            self._oldest = time.monotonic()
+            excess = len(self._rows) - self.max_buffered
+            if excess > 0:
+                dropped, self._rows = self._rows[:excess], self._rows[excess:]
+        if excess > 0:
+            DROPPED_OBSERVATIONS.labels('overflow').inc(excess)
+            logger.error(f"Write buffer full; dropped {excess} observations "
+                         f"from {dropped[0][1]} to {dropped[-1][1]}")
@@ -140,6 +140,365 @@ def test_data_file():
         print(f"❌ Data file test failed: {e}")
         return False
 
+def test_history_paging():
+    """Test keyset paging, time ranges, streaming formats and limits of /api/history"""
+    print("📜 Testing history paging...")
+    try:
+        import sqlite3
+        import tempfile
+        import requests
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+        from load_test import ApiServer
+        from storage import LegacyStorage, from_epoch
+        
+        base = 1_750_000_000
+        rows = [(62901, from_epoch(base + i * 300), 'Available' if i % 2 else 'In Use') for i in range(3)]
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'test.db')
+            conn = sqlite3.connect(db_path)
+            with conn:
+                LegacyStorage().init_schema(conn)
+                LegacyStorage().write(conn, rows)
+            conn.close()
+            
+            # Run against a copy of the database so the tracked one is left alone
+            server = ApiServer(db_path, 'http://127.0.0.1:9/{location_id}', tmp)
+            try:
+                server.wait_ready()
+                url = f"{server.base_url}/api/history"
+                
+                # Two pages of newest-first rows joined by next_cursor
+                first = requests.get(url, params={'limit': 2}, timeout=10).json()
+                second = requests.get(url, params={'limit': 2, 'cursor': first['next_cursor']}, timeout=10).json()
+                timestamps = [row['timestamp'] for row in first['data'] + second['data']]
+                if timestamps != [row[1] for row in reversed(rows)] or second['next_cursor'] is not None:
+                    print(f"❌ Paging returned {first} then {second}")
+                    return False
+                
+                # [start, end) keeps only the middle row
+                ranged = requests.get(url, params={'start': rows[1][1], 'end': rows[2][1]}, timeout=10).json()
+                if [row['timestamp'] for row in ranged['data']] != [rows[1][1]]:
+                    print(f"❌ Range returned {ranged}")
+                    return False
+                
+                ndjson = requests.get(url, params={'format': 'ndjson', 'limit': 2}, timeout=10).text.splitlines()
+                csv_lines = requests.get(url, params={'format': 'csv'}, timeout=10).text.splitlines()
+                if len(ndjson) != 2 or json.loads(ndjson[0])['timestamp'] != rows[2][1] or len(csv_lines) != 4:
+                    print(f"❌ Streaming returned {ndjson} and {csv_lines}")
+                    return False
+                
+                # Edge limits: an empty page, a rejected negative limit, and a capped large one
+                empty = requests.get(url, params={'limit': 0}, timeout=10)
+                negative = requests.get(url, params={'limit': -1}, timeout=10)
+                negative_stream = requests.get(url, params={'limit': -1, 'format': 'ndjson'}, timeout=10)
+                large = requests.get(url, params={'limit': 5000}, timeout=10)
+                if (empty.status_code != 200 or empty.json()['data'] != [] or negative.status_code != 400
+                        or negative_stream.status_code != 400 or large.json()['count'] != len(rows)):
+                    print(f"❌ Edge limits returned {empty.status_code}, {negative.status_code}, "
+                          f"{negative_stream.status_code} and {large.status_code}")
+                    return False
+            finally:
+                server.stop()
+        
+        print("✅ History paging test successful")
+        return True
+    except Exception as e:
+        print(f"❌ History paging test failed: {e}")
+        return False
+
+def test_storage_migration():
+    """Test migrating a legacy database, then writing and reading it back like every component does"""
+    print("🗄️ Testing storage migration...")
+    try:
+        import importlib.util
+        import sqlite3
+        import tempfile
+        import time
+        from charger_scraper import ChargerScraper
+        from database import get_manager
+        from migrate_storage import migrate
+        from storage import IntervalStorage, LegacyStorage, from_epoch
+        
+        widget_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   'ubersicht_widget', 'charger-status.widget', 'get_status.py')
+        spec = importlib.util.spec_from_file_location('get_status', widget_path)
+        widget = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(widget)
+        
+        # Three Available polls, one In Use, one Available, then a two-hour gap before the last poll
+        base = int(time.time()) - 4 * 3600
+        offsets = [0, 300, 600, 900, 1200, 1200 + 7200]
+        statuses = ['Available', 'Available', 'Available', 'In Use', 'Available', 'Available']
+        rows = [(62901, from_epoch(base + offset), status) for offset, status in zip(offsets, statuses)]
+        rows.append((1001, from_epoch(base), 'In Use'))
+        
+        for target in ('compact', 'intervals'):
+            with tempfile.TemporaryDirectory() as tmp:
+                db_path = os.path.join(tmp, 'test.db')
+                conn = sqlite3.connect(db_path)
+                with conn:
+                    LegacyStorage().init_schema(conn)
+                    LegacyStorage().write(conn, rows)
+                conn.close()
+                
+                copied = migrate(db_path, target=target)
+                if copied != len(rows):
+                    print(f"❌ {target}: migrated {copied} of {len(rows)} rows")
+                    return False
+                
+                conn = sqlite3.connect(db_path)
+                tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+                if not {'utilization_legacy', 'station_utilization_legacy'} <= tables or 'utilization' in tables:
+                    print(f"❌ {target}: legacy tables not replaced by the view: {sorted(tables)}")
+                    return False
+                if target == 'intervals':
+                    # Runs break on a status change and on the gap
+                    runs = conn.execute(
+                        'SELECT status, samples FROM status_intervals WHERE station_id = 62901 ORDER BY start_ts'
+                    ).fetchall()
+                    if runs != [(1, 3), (2, 1), (1, 1), (1, 1)]:
+                        print(f"❌ intervals: folded into {runs}")
+                        return False
+                conn.close()
+                
+                # A write after migrating is seen by the scraper and by the widget's utilization query
+                scraper = ChargerScraper(db_path)
+                if scraper.storage.name != target or not scraper.store_status('Out of Order'):
+                    print(f"❌ {target}: scraper uses {scraper.storage.name} storage")
+                    return False
+                latest = scraper.get_latest_status()
+                local = widget.get_status_from_local_db(db_path)
+                if latest['status'] != 'Out of Order' or not local or local['status'] != 'Out of Order':
+                    print(f"❌ {target}: scraper read {latest}, widget read {local}")
+                    return False
+                
+                if target == 'intervals':
+                    # A repeated status extends the open run instead of adding a row
+                    with scraper.db.transaction() as conn:
+                        before = conn.execute('SELECT COUNT(*) FROM status_intervals').fetchone()[0]
+                        IntervalStorage().write(conn, [(62901, from_epoch(time.time() + 60), 'Out of Order')])
+                        after = conn.execute('SELECT COUNT(*) FROM status_intervals').fetchone()[0]
+                    if after != before:
+                        print(f"❌ intervals: repeated status added a run ({before} -> {after})")
+                        return False
+                scraper.close()
+                get_manager(db_path).close_all()
+        
+        print("✅ Storage migration test successful")
+        return True
+    except Exception as e:
+        print(f"❌ Storage migration test failed: {e}")
+        return False
+
+def test_connections():
+    """Test that connections of finished threads are closed"""
+    print("🔌 Testing database connections...")
+    try:
+        import tempfile
+        import threading
+        from database import ConnectionManager
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            manager = ConnectionManager(os.path.join(tmp, 'test.db'))
+            # One short-lived thread per request, like Flask's threaded server
+            for _ in range(50):
+                thread = threading.Thread(target=lambda: manager.connection().execute('SELECT 1'))
+                thread.start()
+                thread.join()
+            manager.connection()
+            if manager.open_connections > 2:
+                print(f"❌ {manager.open_connections} connections still open")
+                return False
+            manager.close_all()
+        
+        print("✅ Connection test successful")
+        return True
+    except Exception as e:
+        print(f"❌ Connection test failed: {e}")
+        return False
+
+def test_fetch_policy():
+    """Test hedging, retries and the circuit breaker against the stub ChargeHub server"""
+    print("🛡️ Testing fetch policy...")
+    try:
+        import tempfile
+        import time
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+        from fake_chargehub import FakeChargeHub
+        from charger_scraper import ChargerScraper
+        from fetch_policy import FetchPolicy
+        
+        with FakeChargeHub() as hub, tempfile.TemporaryDirectory() as tmp:
+            policy = FetchPolicy(hedge_delay=0.2, backoff_base=0.05, failure_threshold=2, reset_timeout=60)
+            scraper = ChargerScraper(os.path.join(tmp, 'test.db'), url_template=hub.url_template,
+                                     fetch_policy=policy)
+            
+            # A slow first reply is overtaken by the hedge
+            hub.slow_next(1, seconds=2.0)
+            started = time.monotonic()
+            status = scraper.scrape_charger_status()
+            if status != 'Available' or time.monotonic() - started > 1.5 or policy.stats['hedge_wins'] != 1:
+                print(f"❌ Hedged fetch returned {status} with {policy.stats}")
+                return False
+            
+            # A transient 503 is retried
+            hub.fail_next(1)
+            status = scraper.scrape_charger_status()
+            if status != 'Available' or policy.stats['retries'] != 1:
+                print(f"❌ Retried fetch returned {status} with {policy.stats}")
+                return False
+            
+            # An outage opens the circuit, which then answers with the last known status
+            hub.set(error_rate=1.0)
+            scraper.scrape_charger_status()
+            served = hub.requests
+            status = scraper.scrape_charger_status()
+            if status != 'Available' or hub.requests != served or policy.stats['short_circuits'] != 1:
+                print(f"❌ Open circuit returned {status} with {policy.stats}")
+                return False
+            scraper.close()
+            
+            # Hedges count against the per-host limit of a sweep
+            hub.set(error_rate=0.0, latency=0.3)
+            policy = FetchPolicy(hedge_delay=0.05)
+            scraper = ChargerScraper(os.path.join(tmp, 'test.db'), url_template=hub.url_template,
+                                     fetch_policy=policy)
+            while hub.in_flight:
+                # The slow request overtaken by the hedge above is still being answered
+                time.sleep(0.05)
+            hub.max_in_flight = 0
+            results = scraper.scrape_stations(range(1, 7), max_workers=6, per_host_limit=2)
+            if hub.max_in_flight > 2 or any(result['status'] != 'Available' for result in results.values()):
+                print(f"❌ Sweep sent {hub.max_in_flight} concurrent requests with a limit of 2")
+                return False
+            scraper.close()
+        
+        print(f"✅ Fetch policy test successful: {policy.stats}")
+        return True
+    except Exception as e:
+        print(f"❌ Fetch policy test failed: {e}")
+        return False
+
+def test_check_queue():
+    """Test that manual checks are coalesced, throttled and limited to configured stations"""
+    print("📬 Testing check queue...")
+    try:
+        import threading
+        from check_queue import CheckJobQueue
+        
+        class SlowScraper:
+            """Stands in for ChargerScraper; each check blocks until released"""
+            location_id = 1
+            
+            def __init__(self):
+                self.release = threading.Event()
+                self.checks = []
+            
+            def run_single_check(self, location_id):
+                self.checks.append(location_id)
+                self.release.wait(5)
+                return True, 'Available'
+        
+        scraper = SlowScraper()
+        queue = CheckJobQueue(scraper, max_workers=4, min_interval=60, stations=[2, 3], max_pending=2)
+        
+        # Concurrent requests for one station share a job
+        first, reason = queue.submit(1)
+        second, coalesced = queue.submit(1)
+        if reason != 'queued' or coalesced != 'coalesced' or second['id'] != first['id']:
+            print(f"❌ Duplicate check was {coalesced}")
+            return False
+        
+        # Unconfigured stations are refused, and so is a check beyond max_pending
+        queue.submit(2)
+        if queue.submit(999) != (None, 'unknown_station') or queue.submit(3) != (None, 'busy'):
+            print("❌ Unknown station or full queue was accepted")
+            return False
+        
+        scraper.release.set()
+        done = queue.wait(first['id'], 5)
+        if done['state'] != 'done' or done['status'] != 'Available':
+            print(f"❌ Check finished as {done}")
+            return False
+        
+        # A repeat within min_interval returns the last result without scraping
+        repeat, throttled = queue.submit(1)
+        if throttled != 'throttled' or repeat['id'] != first['id'] or scraper.checks.count(1) != 1:
+            print(f"❌ Repeat check was {throttled} after {scraper.checks}")
+            return False
+        queue.shutdown()
+        
+        print("✅ Check queue test successful")
+        return True
+    except Exception as e:
+        print(f"❌ Check queue test failed: {e}")
+        return False
+
+def test_buffered_writer():
+    """Test size and age flushes, unstorable rows and a locked database in the write buffer"""
+    print("📦 Testing buffered writer...")
+    try:
+        import sqlite3
+        import tempfile
+        import time
+        from database import ConnectionManager
+        from storage import BufferedWriter, LegacyStorage
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'test.db')
+            db = ConnectionManager(db_path, busy_timeout=0.1)
+            storage = LegacyStorage(1)
+            with db.transaction() as conn:
+                storage.init_schema(conn)
+            stored = lambda: db.connection().execute('SELECT COUNT(*) FROM utilization').fetchone()[0]
+            rows = [(1, f'2024-06-03T08:{minute:02d}:00+00:00', 'Available') for minute in range(60)]
+            
+            # Written once max_rows are buffered, or once the oldest is max_delay old
+            writer = BufferedWriter(db, storage, max_rows=3, max_delay=0.2)
+            writer.extend(rows[:2])
+            if stored() != 0:
+                print("❌ Rows were written before the buffer was full")
+                return False
+            writer.extend(rows[2:3])
+            writer.add(*rows[3])
+            time.sleep(0.3)
+            writer.flush_if_due()
+            if stored() != 4 or len(writer) != 0:
+                print(f"❌ Size and age flushes stored {stored()} rows")
+                return False
+            
+            # A row that can never be stored is dropped without holding back the others
+            writer.extend([rows[4], (1, rows[5][1], 'Bogus'), rows[6]])
+            writer.extend(rows[7:10])
+            if stored() != 9 or len(writer) != 0:
+                print(f"❌ Unstorable row left {stored()} rows stored and {len(writer)} buffered")
+                return False
+            
+            # A locked database keeps rows buffered, up to max_buffered
+            writer = BufferedWriter(db, storage, max_rows=100, max_buffered=5)
+            blocker = sqlite3.connect(db_path)
+            blocker.execute('BEGIN EXCLUSIVE')
+            writer.extend(rows[10:18])
+            try:
+                writer.flush()
+                print("❌ Flush into a locked database succeeded")
+                return False
+            except sqlite3.OperationalError:
+                pass
+            blocker.rollback()
+            blocker.close()
+            if len(writer) != 5 or writer.flush() != 5 or stored() != 14:
+                print(f"❌ Locked database left {len(writer)} rows buffered and {stored()} stored")
+                return False
+            db.close_all()
+        
+        print("✅ Buffered writer test successful")
+        return True
+    except Exception as e:
+        print(f"❌ Buffered writer test failed: {e}")
+        return False
+
 def main():
     """Run all tests"""
     print("🚀 Charger Status Monitor - System Test")
@@ -150,7 +509,13 @@ def main():
         test_scraper,
         test_api,
         test_analysis,
-        test_data_file
+        test_data_file,
+        test_history_paging,
+        test_storage_migration,
+        test_connections,
+        test_buffered_writer,
+        test_fetch_policy,
+        test_check_queue
     ]
     
     passed = 0
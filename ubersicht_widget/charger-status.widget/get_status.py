@@ -5,22 +5,61 @@ Fetches the latest charger status from GitHub or local database
 """
 
 import json
-import requests
 import sqlite3
 import os
 import sys
+import time
 from datetime import datetime
 
-def get_status_from_github():
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Last result plus refresh bookkeeping, kept next to the widget
+CACHE_FILE = os.environ.get('CHARGER_STATUS_CACHE', os.path.join(SCRIPT_DIR, '.status_cache.json'))
+# A cached status younger than this is served without refreshing
+FRESH_SECONDS = 120
+# Older than this the cached status is not shown at all and the refresh happens in the foreground
+STALE_SECONDS = 24 * 3600
+# A background refresh that has not finished after this long is assumed dead
+REFRESH_TIMEOUT = 30
+
+# Foreground fetches only happen without a usable cache, so they give up quickly
+FOREGROUND_TIMEOUT = 3
+BACKGROUND_TIMEOUT = 10
+
+# After a failed GitHub fetch, skip GitHub for BACKOFF_BASE * 2^(failures - 1) seconds, capped
+BACKOFF_BASE = 60
+BACKOFF_MAX = 3600
+
+def load_cache():
+    """Cache contents, or an empty cache if the file is missing or unreadable"""
+    try:
+        with open(CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(cache):
+    """Write the cache atomically so a concurrent reader never sees half a file"""
+    tmp_path = f"{CACHE_FILE}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, CACHE_FILE)
+    except OSError:
+        pass
+
+def get_status_from_github(timeout=BACKGROUND_TIMEOUT):
     """Try to get status from GitHub data file"""
     try:
+        # The standard library client imports in a fraction of the time requests takes,
+        # and the widget runs a fresh interpreter on every refresh
+        import urllib.request
+
         # Replace with your actual GitHub username and repo
         github_url = "https://raw.githubusercontent.com/felixSouan/State_of_the_Charge/main/data.json"
-        
-        response = requests.get(github_url, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
+
+        with urllib.request.urlopen(github_url, timeout=timeout) as response:
+            data = json.load(response)
         return {
             'status': data.get('status', 'Unknown'),
             'timestamp': data.get('timestamp'),
@@ -30,50 +69,123 @@ def get_status_from_github():
     except Exception as e:
         return None
 
-def get_status_from_local_db():
+def find_local_db(cache):
+    """Absolute path of the local database, probed once and remembered in the cache"""
+    db_path = cache.get('db_path')
+    if db_path and os.path.exists(db_path):
+        return db_path
+
+    # Look for database in parent directories
+    db_paths = [
+        'charger_data.db',
+        '../charger_data.db',
+        '../../charger_data.db'
+    ]
+
+    cache['db_path'] = next((os.path.abspath(path) for path in db_paths if os.path.exists(path)), None)
+    return cache['db_path']
+
+def get_status_from_local_db(db_path):
     """Get status from local database"""
+    if not db_path:
+        return None
+
     try:
-        # Look for database in parent directories
-        db_paths = [
-            'charger_data.db',
-            '../charger_data.db',
-            '../../charger_data.db'
-        ]
-        
-        for db_path in db_paths:
-            if os.path.exists(db_path):
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    SELECT timestamp, status FROM utilization
-                    ORDER BY timestamp DESC LIMIT 1
-                ''')
-                
-                result = cursor.fetchone()
-                conn.close()
-                
-                if result:
-                    return {
-                        'status': result[1],
-                        'timestamp': result[0],
-                        'last_updated': result[0],
-                        'source': 'local_db'
-                    }
-                break
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT timestamp, status FROM utilization
+            ORDER BY timestamp DESC LIMIT 1
+        ''')
+
+        result = cursor.fetchone()
+        conn.close()
+
+        if result:
+            return {
+                'status': result[1],
+                'timestamp': result[0],
+                'last_updated': result[0],
+                'source': 'local_db'
+            }
     except Exception as e:
         pass
-    
+
     return None
 
+def refresh(cache, timeout):
+    """Fetch a new status into the cache, skipping GitHub while its circuit is open"""
+    now = time.time()
+    status_data = None
+    if now >= cache.get('retry_at', 0):
+        status_data = get_status_from_github(timeout)
+        if status_data:
+            cache['failures'] = 0
+            cache['retry_at'] = 0
+        else:
+            cache['failures'] = cache.get('failures', 0) + 1
+            cache['retry_at'] = now + min(BACKOFF_BASE * 2 ** (cache['failures'] - 1), BACKOFF_MAX)
+
+    if not status_data:
+        status_data = get_status_from_local_db(find_local_db(cache))
+
+    if status_data:
+        cache['status_data'] = status_data
+        cache['fetched_at'] = now
+    save_cache(cache)
+    return status_data
+
+def refresh_in_background():
+    """Start a detached refresh unless one is already running; never waits for it"""
+    lock_path = f"{CACHE_FILE}.lock"
+    try:
+        if time.time() - os.path.getmtime(lock_path) < REFRESH_TIMEOUT:
+            return
+        os.remove(lock_path)
+    except OSError:
+        pass
+
+    try:
+        # Exclusive create: only one of several concurrent widget runs starts a refresh
+        os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        import subprocess
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--refresh'],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+    except OSError:
+        pass
+
+def background_refresh():
+    """Entry point of the detached refresh process"""
+    try:
+        refresh(load_cache(), BACKGROUND_TIMEOUT)
+    finally:
+        try:
+            os.remove(f"{CACHE_FILE}.lock")
+        except OSError:
+            pass
+
 def main():
     """Main function to get and return status"""
-    # Try GitHub first, then local database
-    status_data = get_status_from_github()
-    
-    if not status_data:
-        status_data = get_status_from_local_db()
-    
+    if sys.argv[1:] == ['--refresh']:
+        background_refresh()
+        return
+
+    # Serve the cached status right away and revalidate it in the background;
+    # only without a usable cache does this run wait on the network
+    cache = load_cache()
+    age = time.time() - cache.get('fetched_at', 0)
+    status_data = cache.get('status_data') if age < STALE_SECONDS else None
+
+    if status_data:
+        if age >= FRESH_SECONDS:
+            refresh_in_background()
+    else:
+        status_data = refresh(cache, FOREGROUND_TIMEOUT)
+
     if not status_data:
         # Fallback to unknown status
         status_data = {
@@ -82,7 +194,7 @@ def main():
             'last_updated': datetime.now().isoformat(),
             'source': 'fallback'
         }
-    
+
     # Output JSON for the widget
     print(json.dumps(status_data))
 
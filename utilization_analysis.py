@@ -4,109 +4,571 @@ Utilization analysis script for charger status data
 Analyzes patterns and provides insights on optimal charging times
 """
 
-import pandas as pd
-import sqlite3
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 import argparse
 import json
 import logging
+import os
+
+from database import close_all, get_manager
+from insights_cache import InsightsCache
+from lazy_import import lazy_module
+import metrics
+from rollups import HOUR, ROLLUP_TABLES, has_rollups
+from storage import DEFAULT_LOCATION_ID, MAX_GAP_SECONDS, STATUS_CODES, STATUS_NAMES, detect_storage, get_storage
+
+# numpy and pandas are imported on first use so importing this module stays cheap
+np = lazy_module('numpy')
+pd = lazy_module('pandas')
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+ANALYSIS_SECONDS = metrics.histogram('charger_analysis_seconds', 'Time to compute an analysis', ['kind'])
+
+# Utilization weight of each status; Unknown is excluded from analysis
+UTILIZATION_WEIGHTS = {'Available': 0, 'In Use': 1, 'Out of Order': 0.5}
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Optional report sections; the overall figures are always computed
+ANALYSIS_SECTIONS = ('hourly', 'daily', 'optimal')
+
+# Rows per chunk when streaming long windows
+DEFAULT_CHUNK_SIZE = 50000
+
+# Status names as a categorical, indexed by status code
+STATUS_CATEGORIES = [STATUS_NAMES[code] for code in range(len(STATUS_CODES))]
+
+def split_spans(ts, codes, width, max_gap=MAX_GAP_SECONDS, held=None):
+    """Split the spans between sorted observations at multiples of width seconds
+
+    Each status holds until the next observation; spans longer than max_gap
+    become Unknown unless marked in held (one flag per span, e.g. the inside
+    of a stored run). Returns (bucket, seconds, status code) arrays with one
+    entry per piece, all in vectorized NumPy.
+    """
+    ts = np.asarray(ts, dtype='int64')
+    codes = np.asarray(codes, dtype='int64')
+    if len(ts) < 2:
+        empty = np.zeros(0, dtype='int64')
+        return empty, empty, empty
+    
+    start, end = ts[:-1], ts[1:]
+    gap = end - start > max_gap
+    if held is not None:
+        gap &= ~np.asarray(held, dtype=bool)
+    status = np.where(gap, STATUS_CODES['Unknown'], codes[:-1])
+    spans = end > start
+    start, end, status = start[spans], end[spans], status[spans]
+    
+    # One piece per bucket a span touches
+    first = start // width
+    pieces = (end - 1) // width - first + 1
+    offsets = np.arange(pieces.sum()) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    bucket = np.repeat(first, pieces) + offsets
+    seconds = (np.minimum(np.repeat(end, pieces), (bucket + 1) * width)
+               - np.maximum(np.repeat(start, pieces), bucket * width))
+    return bucket, seconds, np.repeat(status, pieces)
+
+def time_weighted_occupancy(ts, codes, max_gap=MAX_GAP_SECONDS, held=None):
+    """Seconds spent in each status code per (day of week, UTC hour), shape (7, 24, statuses)
+
+    Spans between observations are split at hour boundaries by split_spans().
+    """
+    statuses = len(STATUS_CODES)
+    bucket, seconds, status = split_spans(ts, codes, HOUR, max_gap, held)
+    hour = bucket % 24
+    day = (bucket // 24 + 3) % 7  # 1970-01-01 was a Thursday
+    index = (day * 24 + hour) * statuses + status
+    return np.bincount(index, weights=seconds, minlength=7 * 24 * statuses).reshape(7, 24, statuses)
+
+def as_datetimes(timestamps):
+    """Parse a timestamp Series unless it already holds datetimes"""
+    if pd.api.types.is_datetime64_any_dtype(timestamps):
+        return timestamps
+    return pd.to_datetime(timestamps)
+
+def epoch_seconds(timestamps):
+    """Integer epoch seconds of a timestamp Series (naive means UTC)"""
+    timestamps = as_datetimes(timestamps)
+    if timestamps.dt.tz is not None:
+        timestamps = timestamps.dt.tz_convert(None)
+    return (timestamps.astype('int64') // 10**9).to_numpy()
+
+def timeline_arrays(frame):
+    """(epoch seconds, status codes) arrays of a timestamp/status frame"""
+    codes = frame['status'].map(STATUS_CODES).fillna(STATUS_CODES['Unknown']).to_numpy(dtype='int64')
+    return epoch_seconds(frame['timestamp']), codes
+
+class UtilizationAccumulator:
+    """Mergeable aggregates of one or more chunks of samples
+
+    Holds the per (day of week, hour) utilization moments, the seconds per
+    status from the time-weighted engine and the observed time range. Adding
+    chunks, stations or shards together gives the same totals as one pass.
+    """
+
+    def __init__(self):
+        self.moments = np.zeros((3, 7, 24))
+        self.occupancy = np.zeros((7, 24, len(STATUS_CODES)))
+        self.start = None
+        self.end = None
+
+    @property
+    def count(self):
+        """Number of known-status samples folded in"""
+        return int(self.moments[0].sum())
+
+    def add(self, moments=None, occupancy=None, start=None, end=None):
+        """Fold one chunk's aggregates in"""
+        if moments is not None:
+            self.moments += moments
+        if occupancy is not None:
+            self.occupancy += occupancy
+        if start is not None and (self.start is None or start < self.start):
+            self.start = start
+        if end is not None and (self.end is None or end > self.end):
+            self.end = end
+        return self
+
+    def merge(self, other):
+        """Fold another accumulator in"""
+        return self.add(other.moments, other.occupancy, other.start, other.end)
+
+def _json_records(stats):
+    """Rows of a stats frame keyed by index, with NaN (days without data, single-sample std) as None"""
+    return stats.astype(object).where(stats.notna(), None).to_dict('index')
+
 class UtilizationAnalyzer:
-    def __init__(self, db_path='charger_data.db'):
+    def __init__(self, db_path='charger_data.db', location_id=DEFAULT_LOCATION_ID):
         self.db_path = db_path
+        self.db = get_manager(db_path)
+        self.location_id = location_id
     
     def load_data(self, days_back=7):
         """Load utilization data from the database"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.db.connection()
             
             # Get data from the last N days
             cutoff_date = datetime.now() - timedelta(days=days_back)
-            cutoff_str = cutoff_date.isoformat()
+            df = self._read_samples(conn, cutoff_date)
+            
+            if df.empty:
+                logger.warning("No data found in the specified time range")
+                return None
+            
+            df = self.prepare_samples(df)
             
+            logger.info(f"Loaded {len(df)} data points from the last {days_back} days")
+            return df
+            
+        except Exception as e:
+            logger.error(f"Error loading data: {e}")
+            return None
+    
+    def load_report_data(self, days_back=7):
+        """Prepared samples and the time-weighted timeline of a window, reading its samples once
+
+        Returns (df, timeline) like load_data and load_timeline. The timeline keeps
+        Unknown samples, so it is taken from the frame before they are dropped.
+        """
+        try:
+            conn = self.db.connection()
+            if detect_storage(conn) == 'intervals':
+                # The timeline comes from the stored runs, not the expanded samples
+                return self.load_data(days_back), self.load_timeline(days_back)
+            
+            cutoff_date = datetime.now() - timedelta(days=days_back)
+            df = self._read_samples(conn, cutoff_date)
+            
+            if df.empty:
+                logger.warning("No data found in the specified time range")
+                return None, None
+            
+            ts, codes = timeline_arrays(df)
+            df = self.prepare_samples(df)
+            
+            logger.info(f"Loaded {len(df)} data points from the last {days_back} days")
+            return df, (ts.astype('int64'), codes.astype('int64'), None)
+            
+        except Exception as e:
+            logger.error(f"Error loading data: {e}")
+            return None, None
+    
+    def prepare_samples(self, df):
+        """Add numeric utilization and integer hour/day-of-week columns, dropping Unknown samples"""
+        df['utilization'] = df['status'].map(UTILIZATION_WEIGHTS).astype('float64')
+        df = df.dropna(subset=['utilization'])
+        
+        timestamps = as_datetimes(df['timestamp'])
+        return df.assign(
+            timestamp=timestamps,
+            status=df['status'].astype('category'),
+            hour=timestamps.dt.hour.astype('int8'),
+            day_of_week=timestamps.dt.dayofweek.astype('int8')
+        )
+    
+    def _sample_query(self, storage, cutoff_date):
+        """SQL and parameters reading the window's samples (or runs), oldest first"""
+        if storage == 'intervals':
+            query = '''
+                SELECT start_ts, end_ts, status, samples FROM status_intervals
+                WHERE station_id = ? AND end_ts >= ?
+                ORDER BY start_ts
+            '''
+            return query, [self.location_id, int(cutoff_date.timestamp())]
+        elif storage == 'compact':
+            # Integer range scan on the clustered (station_id, ts) key
+            query = '''
+                SELECT ts, status FROM samples
+                WHERE station_id = ? AND ts >= ?
+                ORDER BY ts
+            '''
+            return query, [self.location_id, int(cutoff_date.timestamp())]
+        elif self.location_id == DEFAULT_LOCATION_ID:
             query = '''
                 SELECT timestamp, status FROM utilization
                 WHERE timestamp >= ?
                 ORDER BY timestamp
             '''
+            return query, [cutoff_date.isoformat()]
+        else:
+            query = '''
+                SELECT timestamp, status FROM station_utilization
+                WHERE location_id = ? AND timestamp >= ?
+                ORDER BY timestamp
+            '''
+            return query, [self.location_id, cutoff_date.isoformat()]
+    
+    def _samples_frame(self, storage, rows, cutoff_date):
+        """Timestamp/status frame from rows of the sample query"""
+        if storage == 'intervals':
+            # Expand stored runs back into evenly spaced samples
+            intervals = pd.DataFrame.from_records(rows, columns=['start_ts', 'end_ts', 'status', 'samples'])
+            counts = intervals['samples'].to_numpy(dtype='int64')
+            starts = np.repeat(intervals['start_ts'].to_numpy(dtype='int64'), counts)
+            steps = np.repeat(
+                (intervals['end_ts'] - intervals['start_ts']).to_numpy(dtype='int64') / np.maximum(counts - 1, 1),
+                counts
+            )
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            ts = np.rint(starts + steps * offsets).astype('int64')
+            df = pd.DataFrame({
+                'timestamp': pd.to_datetime(ts, unit='s', utc=True),
+                'status': pd.Categorical.from_codes(
+                    np.repeat(intervals['status'].to_numpy(dtype='int64'), counts), STATUS_CATEGORIES
+                )
+            })
+            return df[ts >= int(cutoff_date.timestamp())].reset_index(drop=True)
+        elif storage == 'compact':
+            samples = pd.DataFrame.from_records(rows, columns=['ts', 'status'])
+            return pd.DataFrame({
+                'timestamp': pd.to_datetime(samples['ts'].to_numpy(dtype='int64'), unit='s', utc=True),
+                'status': pd.Categorical.from_codes(samples['status'].to_numpy(dtype='int64'), STATUS_CATEGORIES)
+            })
+        return pd.DataFrame.from_records(rows, columns=['timestamp', 'status'])
+    
+    def _read_samples(self, conn, cutoff_date):
+        """Read timestamp/status samples newer than the cutoff, oldest first"""
+        storage = detect_storage(conn)
+        query, params = self._sample_query(storage, cutoff_date)
+        return self._samples_frame(storage, conn.execute(query, params).fetchall(), cutoff_date)
+    
+    def iter_sample_chunks(self, conn, cutoff_date, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Yield timestamp/status frames of at most chunk_size rows (runs for intervals storage)"""
+        storage = detect_storage(conn)
+        query, params = self._sample_query(storage, cutoff_date)
+        cursor = conn.execute(query, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield self._samples_frame(storage, rows, cutoff_date)
+        finally:
+            cursor.close()
+    
+    def stream_data(self, days_back=7, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Fold the window into an accumulator chunk by chunk, bounding memory by chunk_size"""
+        try:
+            conn = self.db.connection()
+            cutoff_date = datetime.now() - timedelta(days=days_back)
+            accumulator = UtilizationAccumulator()
             
-            df = pd.read_sql_query(query, conn, params=[cutoff_str])
-            conn.close()
+            # The last observation of each chunk starts the first span of the next
+            carry = None
+            chunks = 0
+            for frame in self.iter_sample_chunks(conn, cutoff_date, chunk_size):
+                if frame.empty:
+                    continue
+                chunks += 1
+                ts, codes = timeline_arrays(frame)
+                if carry is not None:
+                    ts = np.concatenate([[carry[0]], ts])
+                    codes = np.concatenate([[carry[1]], codes])
+                carry = (ts[-1], codes[-1])
+                accumulator.add(occupancy=time_weighted_occupancy(ts, codes))
+                self.accumulate(self.prepare_samples(frame), accumulator)
             
-            if df.empty:
+            if accumulator.count == 0:
                 logger.warning("No data found in the specified time range")
                 return None
             
-            # Convert timestamp to datetime
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            df['hour'] = df['timestamp'].dt.hour
-            df['day_of_week'] = df['timestamp'].dt.day_name()
-            df['date'] = df['timestamp'].dt.date
-            
-            # Convert status to numeric for analysis
-            status_mapping = {
-                'Available': 0,      # 0% utilization
-                'In Use': 1,         # 100% utilization
-                'Out of Order': 0.5, # 50% utilization (assume half the time)
-                'Unknown': None      # Exclude from analysis
+            logger.info(f"Streamed {accumulator.count} data points in {chunks} chunks from the last {days_back} days")
+            return accumulator
+            
+        except Exception as e:
+            logger.error(f"Error streaming data: {e}")
+            return None
+    
+    def storage_format(self):
+        """Storage format of the analyzed database"""
+        return detect_storage(self.db.connection())
+    
+    def watermark(self, days_back=7):
+        """Oldest and newest row in the analysis window; moves when rows arrive or age out
+
+        Two index seeks, independent of the window size. Runs are extended in
+        place, so the newest run's end and sample count are part of its row.
+        Rows backfilled into the middle of the window are not detected.
+        """
+        conn = self.db.connection()
+        cutoff_date = datetime.now() - timedelta(days=days_back)
+        storage = detect_storage(conn)
+        query, params = self._sample_query(storage, cutoff_date)
+        
+        # Every sample query ends with its ORDER BY clause
+        oldest = conn.execute(f'{query.rstrip()} LIMIT 1', params).fetchone()
+        newest = conn.execute(f'{query.rstrip()} DESC LIMIT 1', params).fetchone()
+        return [storage, list(oldest or []), list(newest or [])]
+    
+    def list_stations(self):
+        """Location IDs with stored data"""
+        try:
+            conn = self.db.connection()
+            return get_storage('auto', conn, self.location_id).stations(conn)
+        except Exception as e:
+            logger.error(f"Error listing stations: {e}")
+            return []
+    
+    def _read_intervals(self, conn, cutoff_date):
+        """Read the stored runs overlapping the window, oldest first"""
+        query = '''
+            SELECT start_ts, end_ts, status, samples FROM status_intervals
+            WHERE station_id = ? AND end_ts >= ?
+            ORDER BY start_ts
+        '''
+        intervals = pd.read_sql_query(query, conn, params=[self.location_id, int(cutoff_date.timestamp())])
+        intervals['status'] = intervals['status'].map(STATUS_NAMES)
+        return intervals
+    
+    def load_timeline(self, days_back=7):
+        """Load sorted (epoch seconds, status codes, held spans) arrays for the time-weighted engine"""
+        try:
+            conn = self.db.connection()
+            cutoff_date = datetime.now() - timedelta(days=days_back)
+            cutoff_ts = int(cutoff_date.timestamp())
+            
+            if detect_storage(conn) == 'intervals':
+                # A run is its start and end observation; no need to expand it
+                intervals = self._read_intervals(conn, cutoff_date)
+                bounds = np.column_stack([
+                    intervals['start_ts'].clip(lower=cutoff_ts).to_numpy(),
+                    intervals['end_ts'].to_numpy()
+                ])
+                ts = bounds.ravel()
+                codes = np.repeat(intervals['status'].map(STATUS_CODES).to_numpy(), 2)
+                held = np.tile([True, False], len(intervals))[:-1]
+            else:
+                df = self._read_samples(conn, cutoff_date)
+                ts, codes = timeline_arrays(df)
+                held = None
+            
+            if len(ts) == 0:
+                logger.warning("No data found in the specified time range")
+                return None
+            
+            logger.info(f"Loaded a timeline of {len(ts)} observations from the last {days_back} days")
+            return ts.astype('int64'), codes.astype('int64'), held
+            
+        except Exception as e:
+            logger.error(f"Error loading timeline: {e}")
+            return None
+    
+    def analyze_time_weighted(self, timeline):
+        """Duration-weighted utilization overall, by hour of day and by day of week"""
+        if timeline is None:
+            return None
+        
+        ts, codes, held = timeline
+        return self.summarize_occupancy(time_weighted_occupancy(ts, codes, held=held))
+    
+    def summarize_occupancy(self, occupancy):
+        """Availability overall, by hour and by day from a (7, 24, statuses) seconds array"""
+        known = np.array([STATUS_NAMES[code] in UTILIZATION_WEIGHTS for code in range(len(STATUS_CODES))])
+        weights = np.array([UTILIZATION_WEIGHTS.get(STATUS_NAMES[code], 0) for code in range(len(STATUS_CODES))])
+        
+        def availability(seconds):
+            """Availability percentage per row of a (..., status) seconds array, NaN without data"""
+            tracked = seconds[..., known].sum(axis=-1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return (1 - (seconds * weights).sum(axis=-1) / tracked) * 100, tracked
+        
+        by_status = occupancy.sum(axis=(0, 1))
+        overall, tracked = availability(by_status)
+        if tracked == 0:
+            return None
+        
+        by_hour, hour_tracked = availability(occupancy.sum(axis=0))
+        by_day, day_tracked = availability(occupancy.sum(axis=1))
+        return {
+            'tracked_hours': round(tracked / 3600, 1),
+            'unknown_hours': round(by_status[~known].sum() / 3600, 1),
+            'seconds_by_status': {
+                STATUS_NAMES[code]: int(value) for code, value in enumerate(by_status) if value
+            },
+            'average': round(100 - overall, 1),
+            'availability': round(overall, 1),
+            'hourly_availability': {
+                hour: round(by_hour[hour], 1) for hour in range(24) if hour_tracked[hour]
+            },
+            'daily_availability': {
+                DAY_NAMES[day]: round(by_day[day], 1) for day in range(7) if day_tracked[day]
             }
-            df['utilization'] = df['status'].map(status_mapping)
+        }
+    
+    def load_rollups(self, days_back=7, granularity='hourly'):
+        """Load precomputed per-bucket sample counts and seconds by status"""
+        try:
+            conn = self.db.connection()
+            if not has_rollups(conn):
+                logger.warning("Database has no rollup tables (run rollups.py to build them)")
+                return None
             
-            # Remove unknown statuses
-            df = df.dropna(subset=['utilization'])
+            table, width = ROLLUP_TABLES[granularity]
+            cutoff_ts = int((datetime.now() - timedelta(days=days_back)).timestamp())
+            query = f'''
+                SELECT bucket_ts, status, samples, seconds FROM {table}
+                WHERE station_id = ? AND bucket_ts >= ?
+                ORDER BY bucket_ts
+            '''
+            df = pd.read_sql_query(query, conn, params=[self.location_id, cutoff_ts - cutoff_ts % width])
+            if df.empty:
+                logger.warning("No data found in the specified time range")
+                return None
             
-            logger.info(f"Loaded {len(df)} data points from the last {days_back} days")
+            df['bucket'] = pd.to_datetime(df.pop('bucket_ts'), unit='s', utc=True)
+            df['status'] = pd.Categorical.from_codes(df['status'], STATUS_CATEGORIES)
+            df['hour'] = df['bucket'].dt.hour.astype('int8')
+            df['day_of_week'] = df['bucket'].dt.dayofweek.astype('int8')
+            df['utilization'] = df['status'].map(UTILIZATION_WEIGHTS).astype('float64')
+            
+            logger.info(f"Loaded {len(df)} {granularity} rollup rows from the last {days_back} days")
             return df
             
         except Exception as e:
-            logger.error(f"Error loading data: {e}")
+            logger.error(f"Error loading rollups: {e}")
             return None
     
-    def analyze_hourly_patterns(self, df):
-        """Analyze utilization patterns by hour of day"""
+    def compute_moments(self, df):
+        """Count, sum and sum of squares of utilization per (day of week, hour), shape (3, 7, 24)
+
+        One pass over the rows; every section is derived from these sums.
+        Rollup frames are weighted by their sample counts.
+        """
+        utilization = df['utilization'].to_numpy()
+        known = ~np.isnan(utilization)
+        utilization = utilization[known]
+        weights = df['samples'].to_numpy()[known] if 'samples' in df.columns else np.ones(len(utilization))
+        index = (df['day_of_week'].to_numpy(dtype='int64') * 24 + df['hour'].to_numpy(dtype='int64'))[known]
+        
+        moments = [
+            np.bincount(index, weights=weights * utilization ** power, minlength=7 * 24)
+            for power in (0, 1, 2)
+        ]
+        return np.stack(moments).reshape(3, 7, 24)
+    
+    def accumulate(self, df, accumulator=None):
+        """Fold a prepared sample (or rollup) frame's moments and time range into an accumulator"""
+        accumulator = accumulator or UtilizationAccumulator()
         if df is None or df.empty:
+            return accumulator
+        
+        # Rollup rows carry a bucket start rather than a sample timestamp
+        timestamps = df['bucket'][df['utilization'].notna()] if 'samples' in df.columns else df['timestamp']
+        if timestamps.empty:
+            return accumulator
+        return accumulator.add(self.compute_moments(df), start=timestamps.min(), end=timestamps.max())
+    
+    def _stats_frame(self, moments, index):
+        """mean/count/std/availability per group from (count, sum, sum of squares) arrays"""
+        n, s1, s2 = moments
+        present = n > 0
+        n, s1, s2 = n[present], s1[present], s2[present]
+        mean = s1 / n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            variance = np.where(n > 1, (s2 - s1 * mean) / (n - 1), np.nan)
+        
+        stats = pd.DataFrame({
+            'mean': mean,
+            'count': n.astype('int64'),
+            'std': np.sqrt(np.clip(variance, 0, None))
+        }, index=index[present]).round(3)
+        stats['availability_pct'] = (1 - stats['mean']) * 100
+        return stats
+    
+    def analyze_rollup_seconds(self, rollups):
+        """Duration-weighted utilization from the rollup seconds per status"""
+        if rollups is None or rollups.empty:
             return None
         
-        hourly_stats = df.groupby('hour')['utilization'].agg([
-            'mean', 'count', 'std'
-        ]).round(3)
+        seconds = rollups.groupby('status')['seconds'].sum()
+        known = sum(seconds.get(status, 0) for status in UTILIZATION_WEIGHTS)
+        if known == 0:
+            return None
         
-        # Calculate availability percentage
-        hourly_stats['availability_pct'] = (1 - hourly_stats['mean']) * 100
+        utilization = sum(seconds.get(status, 0) * weight for status, weight in UTILIZATION_WEIGHTS.items()) / known
+        return {
+            'tracked_hours': round(known / 3600, 1),
+            'seconds_by_status': {status: int(value) for status, value in seconds.items()},
+            'average': round(utilization * 100, 1),
+            'availability': round((1 - utilization) * 100, 1)
+        }
+    
+    def analyze_hourly_patterns(self, df, moments=None):
+        """Analyze utilization patterns by hour of day (samples or hourly rollups)"""
+        if moments is None:
+            if df is None or df.empty:
+                return None
+            moments = self.compute_moments(df)
+        hourly_stats = self._stats_frame(moments.sum(axis=1), pd.Index(np.arange(24), name='hour'))
         
         # Sort by availability (highest first)
         hourly_stats = hourly_stats.sort_values('availability_pct', ascending=False)
         
         return hourly_stats
     
-    def analyze_daily_patterns(self, df):
-        """Analyze utilization patterns by day of week"""
-        if df is None or df.empty:
-            return None
-        
-        daily_stats = df.groupby('day_of_week')['utilization'].agg([
-            'mean', 'count', 'std'
-        ]).round(3)
-        
-        # Calculate availability percentage
-        daily_stats['availability_pct'] = (1 - daily_stats['mean']) * 100
+    def analyze_daily_patterns(self, df, moments=None):
+        """Analyze utilization patterns by day of week (samples or rollups)"""
+        if moments is None:
+            if df is None or df.empty:
+                return None
+            moments = self.compute_moments(df)
+        daily_stats = self._stats_frame(moments.sum(axis=2), pd.Index(DAY_NAMES, name='day_of_week'))
         
         # Reorder days of week
-        day_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        daily_stats = daily_stats.reindex(day_order)
+        daily_stats = daily_stats.reindex(DAY_NAMES)
         
         return daily_stats
     
-    def find_optimal_times(self, df, min_availability=80):
+    def find_optimal_times(self, df, min_availability=80, hourly_stats=None):
         """Find times with high availability"""
-        if df is None or df.empty:
-            return None
-        
-        hourly_stats = self.analyze_hourly_patterns(df)
+        if hourly_stats is None:
+            hourly_stats = self.analyze_hourly_patterns(df)
         if hourly_stats is None:
             return None
         
@@ -115,46 +577,59 @@ class UtilizationAnalyzer:
         
         return optimal_hours
     
-    def generate_insights(self, df):
-        """Generate comprehensive insights"""
-        if df is None or df.empty:
+    def generate_insights(self, df, sections=ANALYSIS_SECTIONS):
+        """Generate comprehensive insights, computing only the requested sections"""
+        # Every aggregate comes from one pass over the rows
+        return self.insights_from(self.accumulate(df), sections)
+    
+    def insights_from(self, accumulator, sections=ANALYSIS_SECTIONS):
+        """Generate insights from accumulated aggregates"""
+        if accumulator is None or accumulator.count == 0:
             return {
                 'error': 'No data available for analysis',
                 'data_points': 0
             }
         
+        moments = accumulator.moments
+        count, total, _ = moments.sum(axis=(1, 2))
+        mean = total / count
+        
         insights = {
-            'data_points': len(df),
+            'data_points': int(count),
             'date_range': {
-                'start': df['timestamp'].min().isoformat(),
-                'end': df['timestamp'].max().isoformat()
+                'start': accumulator.start.isoformat(),
+                'end': accumulator.end.isoformat()
             },
             'overall_utilization': {
-                'average': round(df['utilization'].mean() * 100, 1),
-                'availability': round((1 - df['utilization'].mean()) * 100, 1)
+                'average': round(mean * 100, 1),
+                'availability': round((1 - mean) * 100, 1)
             }
         }
         
         # Hourly patterns
-        hourly_stats = self.analyze_hourly_patterns(df)
-        if hourly_stats is not None:
+        hourly_stats = None
+        if 'hourly' in sections or 'optimal' in sections:
+            hourly_stats = self.analyze_hourly_patterns(None, moments)
+        if hourly_stats is not None and 'hourly' in sections:
             insights['hourly_patterns'] = {
                 'best_hours': hourly_stats.head(3).index.tolist(),
                 'worst_hours': hourly_stats.tail(3).index.tolist(),
-                'details': hourly_stats.to_dict('index')
+                'details': _json_records(hourly_stats)
             }
         
         # Daily patterns
-        daily_stats = self.analyze_daily_patterns(df)
+        daily_stats = self.analyze_daily_patterns(None, moments) if 'daily' in sections else None
         if daily_stats is not None:
             insights['daily_patterns'] = {
                 'best_days': daily_stats.nlargest(3, 'availability_pct').index.tolist(),
                 'worst_days': daily_stats.nsmallest(3, 'availability_pct').index.tolist(),
-                'details': daily_stats.to_dict('index')
+                'details': _json_records(daily_stats)
             }
         
         # Optimal times
-        optimal_times = self.find_optimal_times(df)
+        optimal_times = None
+        if 'optimal' in sections:
+            optimal_times = self.find_optimal_times(None, hourly_stats=hourly_stats)
         if optimal_times is not None and not optimal_times.empty:
             insights['optimal_times'] = {
                 'hours': optimal_times.index.tolist(),
@@ -163,6 +638,28 @@ class UtilizationAnalyzer:
         
         return insights
     
+    def build_report(self, days_back=7, sections=ANALYSIS_SECTIONS, chunk_size=None):
+        """Insights plus time-weighted figures for the window, streamed when chunk_size is set"""
+        with ANALYSIS_SECONDS.labels('report').time():
+            return self._build_report(days_back, sections, chunk_size)
+    
+    def _build_report(self, days_back, sections, chunk_size):
+        if chunk_size:
+            # Bounded memory: one pass folds each chunk into the accumulators
+            accumulator = self.stream_data(days_back, chunk_size)
+            insights = self.insights_from(accumulator, sections)
+            time_weighted = self.summarize_occupancy(accumulator.occupancy) if accumulator else None
+        else:
+            df, timeline = self.load_report_data(days_back)
+            insights = self.generate_insights(df, sections)
+            
+            # Sample means over-weight densely polled periods; add duration-weighted figures
+            time_weighted = self.analyze_time_weighted(timeline)
+        
+        if time_weighted:
+            insights['time_weighted'] = time_weighted
+        return insights
+    
     def print_report(self, insights):
         """Print a formatted analysis report"""
         print("\n" + "="*60)
@@ -178,6 +675,11 @@ class UtilizationAnalyzer:
         print(f"Overall Availability: {insights['overall_utilization']['availability']}%")
         print(f"Overall Utilization: {insights['overall_utilization']['average']}%")
         
+        if 'time_weighted' in insights:
+            time_weighted = insights['time_weighted']
+            print(f"Time-Weighted Availability: {time_weighted['availability']}% "
+                  f"over {time_weighted['tracked_hours']} tracked hours")
+        
         if 'optimal_times' in insights:
             print(f"\nOptimal Charging Times (80%+ availability):")
             for hour in insights['optimal_times']['hours']:
@@ -198,18 +700,121 @@ class UtilizationAnalyzer:
         
         print("\n" + "="*60)
 
+def _analyze_station(db_path, location_id, days_back, chunk_size):
+    """Process pool task: stream one station into an accumulator"""
+    analyzer = UtilizationAnalyzer(db_path, location_id)
+    try:
+        return location_id, analyzer.stream_data(days_back, chunk_size)
+    finally:
+        close_all()
+
+def analyze_stations(db_path, location_ids, days_back=7, max_workers=None,
+                     chunk_size=DEFAULT_CHUNK_SIZE, sections=ANALYSIS_SECTIONS):
+    """Analyze stations in parallel worker processes
+
+    Each worker streams one station into a mergeable accumulator; the parent
+    builds per-station insights and a combined fleet report from the merged
+    accumulators. Returns {'combined': insights, 'stations': {id: insights}}.
+    """
+    analyzer = UtilizationAnalyzer(db_path)
+    accumulators = {}
+    max_workers = min(max_workers or os.cpu_count() or 1, len(location_ids))
+    if max_workers <= 1:
+        for location_id in location_ids:
+            accumulators[location_id] = _analyze_station(db_path, location_id, days_back, chunk_size)[1]
+    else:
+        # Forked workers must not inherit this process's SQLite connections
+        close_all()
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(_analyze_station, db_path, location_id, days_back, chunk_size)
+                for location_id in location_ids
+            ]
+            for future in futures:
+                try:
+                    location_id, accumulator = future.result()
+                    accumulators[location_id] = accumulator
+                except Exception as e:
+                    logger.error(f"Error analyzing station: {e}")
+    
+    def report(accumulator):
+        insights = analyzer.insights_from(accumulator, sections)
+        if accumulator is not None:
+            time_weighted = analyzer.summarize_occupancy(accumulator.occupancy)
+            if time_weighted:
+                insights['time_weighted'] = time_weighted
+        return insights
+    
+    combined = UtilizationAccumulator()
+    for accumulator in accumulators.values():
+        if accumulator is not None:
+            combined.merge(accumulator)
+    
+    logger.info(f"Analyzed {len(accumulators)} stations with {max_workers} worker(s)")
+    return {
+        'combined': report(combined),
+        'stations': {location_id: report(accumulator) for location_id, accumulator in accumulators.items()}
+    }
+
+def print_station_summary(stations):
+    """Print one availability line per station"""
+    print(f"\n{'Station':>10} {'Data Points':>12} {'Availability':>13} {'Time-Weighted':>14}")
+    for location_id, insights in stations.items():
+        if 'error' in insights:
+            print(f"{location_id:>10} {'-':>12} {'no data':>13}")
+            continue
+        time_weighted = insights.get('time_weighted', {}).get('availability', '-')
+        print(f"{location_id:>10} {insights['data_points']:>12} "
+              f"{insights['overall_utilization']['availability']:>12}% {time_weighted:>13}%")
+
 def main():
     """Main function for command-line usage"""
     parser = argparse.ArgumentParser(description='Analyze charger utilization patterns')
     parser.add_argument('--days', type=int, default=7, help='Number of days to analyze (default: 7)')
     parser.add_argument('--output', type=str, help='Output file for JSON results')
     parser.add_argument('--db', type=str, default='charger_data.db', help='Database file path')
+    parser.add_argument('--rollups', action='store_true',
+                        help='Analyze the precomputed hourly rollup tables instead of raw samples')
+    parser.add_argument('--sections', nargs='+', choices=ANALYSIS_SECTIONS, default=list(ANALYSIS_SECTIONS),
+                        help='Report sections to compute (default: all)')
+    parser.add_argument('--chunk-size', type=int,
+                        help='Stream the window in chunks of this many rows instead of loading it at once')
+    parser.add_argument('--stations', type=int, nargs='+', help='Location IDs to analyze in parallel')
+    parser.add_argument('--all-stations', action='store_true', help='Analyze every station in the database')
+    parser.add_argument('--workers', type=int, help='Worker processes for multi-station analysis (default: CPU count)')
+    parser.add_argument('--no-cache', action='store_true', help='Recompute instead of reusing a cached report')
     
     args = parser.parse_args()
     
     analyzer = UtilizationAnalyzer(args.db)
-    df = analyzer.load_data(args.days)
-    insights = analyzer.generate_insights(df)
+    if args.stations or args.all_stations:
+        location_ids = args.stations or analyzer.list_stations()
+        if not location_ids:
+            logger.warning("No stations to analyze")
+            return 1
+        results = analyze_stations(
+            args.db, location_ids, args.days, args.workers,
+            args.chunk_size or DEFAULT_CHUNK_SIZE, args.sections
+        )
+        analyzer.print_report(results['combined'])
+        print_station_summary(results['stations'])
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f"\nResults saved to {args.output}")
+        return 0
+    
+    if args.rollups:
+        df = analyzer.load_rollups(args.days)
+        insights = analyzer.generate_insights(df, args.sections)
+        time_weighted = analyzer.analyze_rollup_seconds(df)
+        if time_weighted:
+            insights['time_weighted'] = time_weighted
+    elif args.no_cache:
+        insights = analyzer.build_report(args.days, args.sections, args.chunk_size)
+    else:
+        # Reuse the last report unless rows entered or left the window
+        insights = InsightsCache(args.db).report(analyzer, args.days, args.sections, args.chunk_size)
     
     # Print report
     analyzer.print_report(insights)
@@ -219,6 +824,7 @@ def main():
         with open(args.output, 'w') as f:
             json.dump(insights, f, indent=2)
         print(f"\nResults saved to {args.output}")
+    return 0
 
 if __name__ == "__main__":
-    main()
+    exit(main())